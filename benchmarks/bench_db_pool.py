@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""Сравнение пула SQLite-соединений с прежним «connect на каждый вызов».
+
+Usage:
+  python benchmarks/bench_db_pool.py [--ops 20000] [--threads 4]
+
+Создаёт временную БД через `database.initialize_db()`, затем гоняет типичные
+горячие чтения (`get_setting`, `get_user`, `get_key_by_id`) двумя способами:
+через пул (`database._connect`) и через `sqlite3.connect(DB_FILE)` как раньше.
+Печатает ops/sec для одного и нескольких потоков и счётчики пула в JSON.
+"""
+import argparse
+import json
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parents[1] / "src"
+if str(SRC_DIR) not in sys.path:
+    sys.path.insert(0, str(SRC_DIR))
+
+from shop_bot.data_manager import database, db_pool  # noqa: E402
+
+
+def _legacy_get_setting(key: str):
+    with sqlite3.connect(database.DB_FILE) as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT value FROM bot_settings WHERE key = ?", (key,))
+        row = cur.fetchone()
+        return row[0] if row else None
+
+
+def _legacy_get_user(telegram_id: int):
+    with sqlite3.connect(database.DB_FILE) as conn:
+        conn.row_factory = sqlite3.Row
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
+        row = cur.fetchone()
+        return dict(row) if row else None
+
+
+def _legacy_get_key_by_id(key_id: int):
+    with sqlite3.connect(database.DB_FILE) as conn:
+        conn.row_factory = sqlite3.Row
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM vpn_keys WHERE key_id = ?", (key_id,))
+        row = cur.fetchone()
+        return dict(row) if row else None
+
+
+def _workload(get_setting, get_user, get_key_by_id, ops: int) -> None:
+    for i in range(ops):
+        m = i % 3
+        if m == 0:
+            get_setting("telegram_bot_token")
+        elif m == 1:
+            get_user(1000 + (i % 100))
+        else:
+            get_key_by_id(1 + (i % 100))
+
+
+def _run(fns, ops: int, threads: int) -> float:
+    per_thread = max(1, ops // threads)
+
+    def _target():
+        _workload(*fns, per_thread)
+        db_pool.close_thread_connections()
+
+    started = time.perf_counter()
+    if threads == 1:
+        _workload(*fns, per_thread)
+    else:
+        pool = [threading.Thread(target=_target) for _ in range(threads)]
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+    elapsed = time.perf_counter() - started
+    return round(per_thread * threads / elapsed, 1)
+
+
+def _seed() -> None:
+    database.update_setting("telegram_bot_token", "123:bench")
+    with database._connect() as conn:
+        for i in range(100):
+            conn.execute(
+                "INSERT OR IGNORE INTO users (telegram_id, username) VALUES (?, ?)",
+                (1000 + i, f"user{i}"),
+            )
+            conn.execute(
+                "INSERT INTO vpn_keys (user_id, host_name, key_email, expire_at) "
+                "VALUES (?, 'bench', ?, datetime('now', '+30 days'))",
+                (1000 + i, f"user{i}@bench"),
+            )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ops", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DB_FILE = Path(tmp) / "bench.db"
+        database.initialize_db()
+        _seed()
+
+        legacy = (_legacy_get_setting, _legacy_get_user, _legacy_get_key_by_id)
+        pooled = (database.get_setting, database.get_user, database.get_key_by_id)
+
+        db_pool.reset_stats()
+        result = {
+            "ops": args.ops,
+            "threads": args.threads,
+            "connect_per_call_ops_sec": _run(legacy, args.ops, 1),
+            "pooled_ops_sec": _run(pooled, args.ops, 1),
+            "connect_per_call_ops_sec_mt": _run(legacy, args.ops, args.threads),
+            "pooled_ops_sec_mt": _run(pooled, args.ops, args.threads),
+        }
+        result["speedup"] = round(result["pooled_ops_sec"] / max(result["connect_per_call_ops_sec"], 1e-9), 2)
+        result["speedup_mt"] = round(result["pooled_ops_sec_mt"] / max(result["connect_per_call_ops_sec_mt"], 1e-9), 2)
+        result["pool"] = db_pool.get_stats()
+        db_pool.close_thread_connections()
+
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
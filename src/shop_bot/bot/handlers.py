@@ -39,6 +39,7 @@ from shop_bot.data_manager.remnawave_repository import (
     add_to_balance,
     deduct_from_balance,
     get_setting,
+    get_settings,
     get_user,
     register_user_if_not_exists,
     get_next_key_number,
@@ -124,36 +125,31 @@ def _is_true(value) -> bool:
 
 def _get_payment_methods() -> dict:
     """Собирает доступные способы оплаты из актуальных настроек (без перезапуска бота)."""
-    yookassa_shop_id = get_setting('yookassa_shop_id')
-    yookassa_secret_key = get_setting('yookassa_secret_key')
-    yookassa_enabled = bool(yookassa_shop_id and yookassa_secret_key)
+    cfg = get_settings((
+        'yookassa_shop_id', 'yookassa_secret_key', 'cryptobot_token',
+        'heleket_merchant_id', 'heleket_api_key', 'platega_merchant_id', 'platega_secret',
+        'ton_wallet_address', 'tonapi_key', 'yoomoney_enabled', 'yoomoney_wallet',
+        'yoomoney_secret', 'stars_enabled', 'stars_per_rub',
+    ))
+    yookassa_enabled = bool(cfg['yookassa_shop_id'] and cfg['yookassa_secret_key'])
 
-    cryptobot_token = get_setting('cryptobot_token')
-    cryptobot_enabled = bool(cryptobot_token)
+    cryptobot_enabled = bool(cfg['cryptobot_token'])
 
-    heleket_shop_id = get_setting('heleket_merchant_id')
-    heleket_api_key = get_setting('heleket_api_key')
-    heleket_enabled = bool(heleket_shop_id and heleket_api_key)
+    heleket_enabled = bool(cfg['heleket_merchant_id'] and cfg['heleket_api_key'])
 
-    platega_merchant_id = get_setting('platega_merchant_id')
-    platega_secret = get_setting('platega_secret')
-    platega_enabled = bool(platega_merchant_id and platega_secret)
+    platega_enabled = bool(cfg['platega_merchant_id'] and cfg['platega_secret'])
 
-    ton_wallet_address = get_setting('ton_wallet_address')
-    tonapi_key = get_setting('tonapi_key')
-    tonconnect_enabled = bool(ton_wallet_address and tonapi_key)
+    tonconnect_enabled = bool(cfg['ton_wallet_address'] and cfg['tonapi_key'])
 
-    yoomoney_raw = get_setting('yoomoney_enabled')
-    yoomoney_wallet = get_setting('yoomoney_wallet')
-    yoomoney_secret = get_setting('yoomoney_secret')
+    yoomoney_raw = cfg['yoomoney_enabled']
     if yoomoney_raw is None:
-        yoomoney_enabled = bool(yoomoney_wallet and yoomoney_secret)
+        yoomoney_enabled = bool(cfg['yoomoney_wallet'] and cfg['yoomoney_secret'])
     else:
         yoomoney_enabled = _is_true(yoomoney_raw)
 
-    stars_flag = _is_true(get_setting('stars_enabled') or 'false')
+    stars_flag = _is_true(cfg['stars_enabled'] or 'false')
     try:
-        stars_ratio = float(get_setting('stars_per_rub') or '0')
+        stars_ratio = float(cfg['stars_per_rub'] or '0')
     except Exception:
         stars_ratio = 0.0
     stars_enabled = stars_flag and (stars_ratio > 0)
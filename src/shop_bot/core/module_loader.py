@@ -510,11 +510,13 @@ class ModuleLoader:
                         "INSERT OR REPLACE INTO bot_settings (key, value) VALUES (?, ?)",
                         (full_key, value),
                     )
+        database.invalidate_settings_cache()
 
     def _delete_settings_prefix(self, module_id: str) -> None:
         with sqlite3.connect(self._db_file) as conn:
             cur = conn.cursor()
             cur.execute("DELETE FROM bot_settings WHERE key LIKE ?", (f"{module_id}_%",))
+        database.invalidate_settings_cache()
 
     def _attach_router(self, module_id: str, router: Router) -> None:
         if not self._dispatcher:
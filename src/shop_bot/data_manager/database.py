@@ -6,11 +6,15 @@ import hashlib
 import hmac
 import json
 import secrets
+import threading
 import time
 import re
 import uuid
+from contextlib import closing, contextmanager
 from typing import Any
 
+from shop_bot.data_manager import db_pool
+
 logger = logging.getLogger(__name__)
 
 
@@ -32,6 +36,21 @@ else:
     DB_FILE = Path("users.db")
 
 
+def _connect():
+    """Соединение с `DB_FILE` из пула текущего потока (см. `db_pool`).
+
+    Используется как `with _connect() as conn:` — семантика та же, что у
+    `with _connect() as conn:` (commit/rollback на выходе), но
+    соединение не открывается заново на каждый вызов, а WAL/busy_timeout
+    уже настроены.
+    """
+    return db_pool.connect(DB_FILE)
+
+
+def get_db_pool_stats() -> dict:
+    return db_pool.get_stats()
+
+
 def _now_str() -> str:
     return datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
 
@@ -275,7 +294,7 @@ def normalize_host_name(name: str | None) -> str:
 
 def initialize_db():
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS users (
@@ -402,6 +421,7 @@ def initialize_db():
                     value TEXT
                 )
             ''')
+            _ensure_settings_generation(cursor)
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS modules_registry (
                     module_id     TEXT PRIMARY KEY,
@@ -1057,7 +1077,7 @@ def upsert_key_node_usage_snapshot(
     if not node_uuid_n or not key_id:
         return False
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """
@@ -1093,7 +1113,7 @@ def get_node_usage_for_key(key_id: int, period_start: str | None = None) -> list
     Без `period_start` берётся последний известный период этого ключа.
     """
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             if period_start is None:
@@ -1119,7 +1139,7 @@ def get_node_usage_for_key(key_id: int, period_start: str | None = None) -> list
 def delete_node_usage_for_key(key_id: int) -> bool:
     """Удалить все снапшоты ключа (используется при удалении ключа)."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM key_node_usage_snapshots WHERE key_id = ?", (int(key_id),))
             conn.commit()
@@ -1386,7 +1406,7 @@ def add_host_squad(host_name: str, squad_uuid: str, squad_class: str = 'base', l
         logging.warning("add_host_squad: host_name и squad_uuid обязательны")
         return None
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             # Не более одного активного сквада класса 'base'/'lte' на хост.
             if squad_class_n in ('base', 'lte'):
@@ -1418,7 +1438,7 @@ def add_host_squad(host_name: str, squad_uuid: str, squad_class: str = 'base', l
 def get_host_squads(host_name: str, *, only_active: bool = False) -> list[dict]:
     try:
         host_name_n = normalize_host_name(host_name)
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             query = "SELECT * FROM host_squads WHERE TRIM(host_name) = TRIM(?) COLLATE NOCASE"
@@ -1444,7 +1464,7 @@ def get_squad_by_class(host_name: str, squad_class: str) -> dict | None:
     squad_class_n = str(squad_class or '').strip().lower()
     try:
         host_name_n = normalize_host_name(host_name)
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute(
@@ -1461,7 +1481,7 @@ def get_squad_by_class(host_name: str, squad_class: str) -> dict | None:
 
 def set_host_squad_active(squad_id: int, is_active: bool) -> bool:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "UPDATE host_squads SET is_active = ? WHERE id = ?",
@@ -1476,7 +1496,7 @@ def set_host_squad_active(squad_id: int, is_active: bool) -> bool:
 
 def delete_host_squad(squad_id: int) -> bool:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM host_squads WHERE id = ?", (int(squad_id),))
             conn.commit()
@@ -1558,7 +1578,7 @@ def _ensure_remnawave_squads_catalog(cursor: sqlite3.Cursor) -> None:
 
 def get_remnawave_squads(*, only_active: bool = False) -> list[dict]:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             query = "SELECT * FROM remnawave_squads"
@@ -1580,7 +1600,7 @@ def add_remnawave_squad(squad_uuid: str, squad_class: str = "base", label: str |
     if not uuid_n:
         return None
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """
@@ -1601,7 +1621,7 @@ def add_remnawave_squad(squad_uuid: str, squad_class: str = "base", label: str |
 
 def delete_remnawave_squad(squad_id: int) -> bool:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("SELECT squad_uuid FROM remnawave_squads WHERE id = ?", (int(squad_id),))
@@ -1631,7 +1651,7 @@ def seed_global_remnawave_from_hosts() -> None:
         sub = (get_setting("remnawave_subscription_url") or "").strip()
         if base and token and sub:
             return
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute(
@@ -1701,7 +1721,7 @@ def set_host_squads_from_catalog(host_name: str, catalog_ids: list[int]) -> bool
         return False
     try:
         wanted_ids = {int(x) for x in (catalog_ids or []) if str(x).strip().isdigit() or isinstance(x, int)}
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("SELECT 1 FROM xui_hosts WHERE TRIM(host_name) = TRIM(?)", (host_name_n,))
@@ -1785,7 +1805,7 @@ def get_host_selected_squad_catalog_ids(host_name: str) -> list[int]:
     """ID записей каталога, привязанных к хосту через host_squads.uuid."""
     try:
         host_name_n = normalize_host_name(host_name)
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """
@@ -1988,7 +2008,9 @@ def run_migration():
     logging.info("Запуск миграций базы данных: %s", DB_FILE)
 
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        # Отдельное (не пулированное) соединение: миграция переключает
+        # PRAGMA foreign_keys, и это состояние не должно попасть в пул.
+        with closing(sqlite3.connect(DB_FILE)) as conn, conn:
             cursor = conn.cursor()
             cursor.execute("PRAGMA foreign_keys = OFF")
             _ensure_users_columns(cursor)
@@ -2067,7 +2089,7 @@ def insert_resource_metric(
     raw_json: str | None = None,
 ) -> int | None:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 '''
@@ -2092,7 +2114,7 @@ def insert_resource_metric(
 
 def get_latest_resource_metric(scope: str, object_name: str) -> dict | None:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute(
@@ -2113,7 +2135,7 @@ def get_latest_resource_metric(scope: str, object_name: str) -> dict | None:
 
 def get_metrics_series(scope: str, object_name: str, *, since_hours: int = 24, limit: int = 500) -> list[dict]:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -2164,7 +2186,7 @@ def create_host(name: str, url: str, user: str, passwd: str, inbound: int, subsc
             pass
         subscription_url = (subscription_url or None)
 
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             try:
                 cursor.execute(
@@ -2184,7 +2206,7 @@ def create_host(name: str, url: str, user: str, passwd: str, inbound: int, subsc
 def update_host_subscription_url(host_name: str, subscription_url: str | None) -> bool:
     try:
         host_name = normalize_host_name(host_name)
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT 1 FROM xui_hosts WHERE TRIM(host_name) = TRIM(?)", (host_name,))
             exists = cursor.fetchone() is not None
@@ -2211,7 +2233,7 @@ def claim_referral_start_bonus(user_id: int) -> bool:
     параллельные /start (или pending-action) дважды кредитуют одну и ту же сумму.
     """
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """
@@ -2243,7 +2265,7 @@ def set_referral_start_bonus_received(user_id: int) -> bool:
 def set_referral_trial_day_bonus_received(user_id: int) -> bool:
     """Пометить, что за данного пользователя уже начислялся +1 день рефереру за активацию триала."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "UPDATE users SET referral_trial_day_bonus_received = 1 WHERE telegram_id = ?",
@@ -2262,7 +2284,7 @@ def update_host_url(host_name: str, new_url: str) -> bool:
     try:
         host_name = normalize_host_name(host_name)
         new_url = (new_url or "").strip()
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT 1 FROM xui_hosts WHERE TRIM(host_name) = TRIM(?)", (host_name,))
             if cursor.fetchone() is None:
@@ -2291,7 +2313,7 @@ def update_host_remnawave_settings(
     """
     try:
         host_name_n = normalize_host_name(host_name)
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT 1 FROM xui_hosts WHERE TRIM(host_name) = TRIM(?)", (host_name_n,))
             if cursor.fetchone() is None:
@@ -2328,7 +2350,7 @@ def get_host_class(host_name: str) -> str:
     """Класс ноды: 'premium' (💰) или 'unlim' (∞, по умолчанию)."""
     try:
         host_name_n = normalize_host_name(host_name)
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "SELECT node_class FROM xui_hosts WHERE TRIM(host_name) = TRIM(?) COLLATE NOCASE",
@@ -2348,7 +2370,7 @@ def set_host_class(host_name: str, node_class: str, badge: str | None = None) ->
         badge = '💰' if node_class == 'premium' else '∞'
     try:
         host_name_n = normalize_host_name(host_name)
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "UPDATE xui_hosts SET node_class = ?, badge = ? WHERE TRIM(host_name) = TRIM(?)",
@@ -2376,7 +2398,7 @@ def set_host_squad_overlap(host_name: str, overlap_nodes: list[dict] | None) ->
             ],
             ensure_ascii=False,
         )
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "UPDATE xui_hosts SET squad_node_overlap = ?, squad_node_overlap_checked_at = ? "
@@ -2393,7 +2415,7 @@ def set_host_squad_overlap(host_name: str, overlap_nodes: list[dict] | None) ->
 def get_host_squad_overlap(host_name: str) -> list[dict]:
     """Ноды, доступные и через LTE-, и через base-сквад хоста (по последней проверке)."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "SELECT squad_node_overlap FROM xui_hosts "
@@ -2414,7 +2436,7 @@ def get_host_squad_overlap(host_name: str) -> list[dict]:
 def list_hosts_by_class(node_class: str) -> list[dict]:
     node_class = 'premium' if str(node_class).strip().lower() == 'premium' else 'unlim'
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM xui_hosts WHERE COALESCE(node_class, 'unlim') = ?", (node_class,))
@@ -2432,7 +2454,7 @@ def update_host_name(old_name: str, new_name: str) -> bool:
         if not new_name_n:
             logging.warning("update_host_name: new host name is empty after normalization")
             return False
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT 1 FROM xui_hosts WHERE TRIM(host_name) = TRIM(?)", (old_name_n,))
             if cursor.fetchone() is None:
@@ -2471,7 +2493,7 @@ def update_host_name(old_name: str, new_name: str) -> bool:
 def delete_host(host_name: str):
     try:
         host_name = normalize_host_name(host_name)
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM plans WHERE TRIM(host_name) = TRIM(?)", (host_name,))
             cursor.execute("DELETE FROM xui_hosts WHERE TRIM(host_name) = TRIM(?)", (host_name,))
@@ -2489,7 +2511,7 @@ def delete_host(host_name: str):
 def get_host(host_name: str) -> dict | None:
     try:
         host_name = normalize_host_name(host_name)
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM xui_hosts WHERE TRIM(host_name) = TRIM(?)", (host_name,))
@@ -2512,7 +2534,7 @@ def update_host_ssh_settings(
     """
     try:
         host_name_n = normalize_host_name(host_name)
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT 1 FROM xui_hosts WHERE TRIM(host_name) = TRIM(?)", (host_name_n,))
             if cursor.fetchone() is None:
@@ -2542,7 +2564,7 @@ def update_host_ssh_settings(
 
 def delete_key_by_id(key_id: int) -> bool:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             # Ключ может быть привязан к неактивированному подарку (user_gifts.key_id) —
             # при удалении ключа (по истечении срока, вручную и т.д.) подарок должен
@@ -2560,7 +2582,7 @@ def delete_key_by_id(key_id: int) -> bool:
 
 def update_key_comment(key_id: int, comment: str) -> bool:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("UPDATE vpn_keys SET comment_key = ? WHERE key_id = ?", (comment, key_id))
             conn.commit()
@@ -2593,7 +2615,7 @@ def update_key_name(key_id: int, new_name: str | None) -> bool:
         else:
             new_name = None
         
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "UPDATE vpn_keys SET user_key_name = ?, updated_at = CURRENT_TIMESTAMP WHERE key_id = ?",
@@ -2608,7 +2630,7 @@ def update_key_name(key_id: int, new_name: str | None) -> bool:
 
 def get_all_hosts() -> list[dict]:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM xui_hosts")
@@ -2628,7 +2650,7 @@ def get_speedtests(host_name: str, limit: int = 20) -> list[dict]:
     """Получить последние результаты спидтестов по хосту (ssh/net), новые сверху."""
     try:
         host_name_n = normalize_host_name(host_name)
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             try:
@@ -2656,7 +2678,7 @@ def get_latest_speedtest(host_name: str) -> dict | None:
     """Получить последний по времени спидтест для хоста."""
     try:
         host_name_n = normalize_host_name(host_name)
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute(
@@ -2694,7 +2716,7 @@ def insert_host_speedtest(
         method_s = (method or '').strip().lower()
         if method_s not in ('ssh', 'net'):
             method_s = 'ssh'
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 '''
@@ -2865,7 +2887,7 @@ def create_pending_action(
         return None
     token = secrets.token_urlsafe(32)
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """
@@ -2888,7 +2910,7 @@ def get_pending_action(token: str) -> dict | None:
     if not token:
         return None
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM auth_pending_actions WHERE token = ?", (str(token),))
@@ -2910,7 +2932,7 @@ def claim_pending_action(token: str, user_id: int) -> bool:
     claim_pending_action вернёт True ровно для одного из них.
     """
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """
@@ -2933,7 +2955,7 @@ def set_pending_action_result(token: str, result_status: str) -> bool:
     вернуть тот же самый структурированный результат без повторного выполнения
     бизнес-логики."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "UPDATE auth_pending_actions SET result_status = ? WHERE token = ?",
@@ -2951,7 +2973,7 @@ def cleanup_expired_pending_actions(max_age_hours: int = 72) -> int:
     не обязательна для корректности — claim_pending_action и без этого не
     применит просроченный токен)."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "DELETE FROM auth_pending_actions WHERE expires_at < datetime('now', ?)",
@@ -3140,7 +3162,7 @@ def _ensure_analytics_tables(cursor: sqlite3.Cursor) -> None:
 def get_all_ssh_targets() -> list[dict]:
     """Вернуть все SSH-цели для спидтестов (включая неактивные), сортировка по sort_order, затем по имени."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM speedtest_ssh_targets ORDER BY sort_order ASC, target_name ASC")
@@ -3154,7 +3176,7 @@ def get_all_ssh_targets() -> list[dict]:
 def get_ssh_target(target_name: str) -> dict | None:
     try:
         name = normalize_host_name(target_name)
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM speedtest_ssh_targets WHERE TRIM(target_name) = TRIM(?)", (name,))
@@ -3179,7 +3201,7 @@ def create_ssh_target(
 ) -> bool:
     try:
         name = normalize_host_name(target_name)
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """
@@ -3220,7 +3242,7 @@ def update_ssh_target_fields(
 ) -> bool:
     try:
         name = normalize_host_name(target_name)
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT 1 FROM speedtest_ssh_targets WHERE TRIM(target_name) = TRIM(?)", (name,))
             if cursor.fetchone() is None:
@@ -3275,7 +3297,7 @@ def update_ssh_target_fields(
 def delete_ssh_target(target_name: str) -> bool:
     try:
         name = normalize_host_name(target_name)
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM speedtest_ssh_targets WHERE TRIM(target_name) = TRIM(?)", (name,))
             affected = cursor.rowcount
@@ -3304,7 +3326,7 @@ def get_admin_stats() -> dict:
         "today_issued_keys": 0,
     }
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
 
             cursor.execute("SELECT COUNT(*) FROM users")
@@ -3385,7 +3407,7 @@ def get_sales_overview() -> dict:
     periods = {"today": 0, "d7": 7, "d30": 30, "all": None}
     result: dict = {}
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             for key, days in periods.items():
                 if key == "today":
@@ -3505,7 +3527,7 @@ def get_revenue_series(days: int = 30) -> dict:
     Использует тот же SQL-фильтр успешности, что и get_sales_overview()."""
     series = {"revenue": {}, "transactions": {}}
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 f"""
@@ -3530,7 +3552,7 @@ def get_plans_analytics(limit: int = 10) -> list[dict]:
     """Аналитика по тарифам (Этап 4.4): выручка, продажи, средний чек, доля повторных покупок."""
     result: list[dict] = []
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 f"""
@@ -3582,7 +3604,7 @@ def get_payment_methods_analytics() -> list[dict]:
     """Аналитика по методам оплаты (Этап 4.5): число транзакций, выручка, успешность, динамика."""
     result: list[dict] = []
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """
@@ -3621,7 +3643,7 @@ def get_users_without_real_payment_with_keys() -> dict:
     """
     result = {"users_with_key_no_real_payment": 0}
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 f"""
@@ -3664,7 +3686,7 @@ def get_trial_key_stats() -> dict:
         "extended_trial_via_referral_balance": 0,
     }
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
 
             cursor.execute(
@@ -3741,7 +3763,7 @@ def get_referrals_analytics() -> dict:
         "revenue_from_referrals": 0.0,
     }
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT COUNT(DISTINCT referred_by) FROM users WHERE referred_by IS NOT NULL")
             data["referrers_count"] = int((cursor.fetchone() or [0])[0] or 0)
@@ -3794,7 +3816,7 @@ def get_top_referrers(limit: int = 10) -> list[dict]:
     """Топ пользователей по рефералам: число приглашённых и число платящих рефералов."""
     result: list[dict] = []
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute(
@@ -3835,7 +3857,7 @@ def get_top_buyers(limit: int = 10) -> list[dict]:
     """Топ пользователей по покупкам (Этап 6.4): сумма, число успешных транзакций, средний чек."""
     result: list[dict] = []
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute(
@@ -3900,7 +3922,7 @@ def get_coupons_analytics() -> list[dict]:
     promo_codes / promo_code_usages — без создания новой системы купонов."""
     result: list[dict] = []
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM promo_codes ORDER BY created_at DESC")
@@ -3976,7 +3998,7 @@ def get_coupons_analytics() -> list[dict]:
 
 def get_server_cost_entries(*, only_active: bool = False) -> list[dict]:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             query = "SELECT * FROM server_cost_entries"
@@ -4004,7 +4026,7 @@ def create_server_cost_entry(
     comment: str | None = None,
 ) -> int | None:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """
@@ -4047,7 +4069,7 @@ def update_server_cost_entry(entry_id: int, **fields) -> bool:
     sets.append("updated_at = CURRENT_TIMESTAMP")
     params.append(int(entry_id))
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(f"UPDATE server_cost_entries SET {', '.join(sets)} WHERE id = ?", params)
             conn.commit()
@@ -4059,7 +4081,7 @@ def update_server_cost_entry(entry_id: int, **fields) -> bool:
 
 def delete_server_cost_entry(entry_id: int) -> bool:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM server_cost_entries WHERE id = ?", (int(entry_id),))
             conn.commit()
@@ -4121,7 +4143,7 @@ def get_revenue_forecast() -> dict:
         "forecast_transactions_month_end": 0,
     }
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 f"""
@@ -4162,7 +4184,7 @@ def get_revenue_forecast() -> dict:
 
 def get_utm_links(*, only_active: bool = False) -> list[dict]:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             query = "SELECT * FROM utm_links"
@@ -4193,7 +4215,7 @@ def create_utm_link(
     if not slug_s:
         return False
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """
@@ -4218,7 +4240,7 @@ def delete_utm_link(slug: str) -> bool:
     if not slug_s:
         return False
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM utm_visits WHERE slug = ?", (slug_s,))
             cursor.execute("DELETE FROM utm_links WHERE slug = ?", (slug_s,))
@@ -4232,7 +4254,7 @@ def delete_utm_link(slug: str) -> bool:
 def log_utm_visit(slug: str, user_id: int | None, event_type: str) -> None:
     """Best-effort запись события UTM (клик/старт/регистрация/оплата). Никогда не бросает исключение наружу."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "INSERT INTO utm_visits (slug, user_id, event_type) VALUES (?, ?, ?)",
@@ -4246,7 +4268,7 @@ def log_utm_visit(slug: str, user_id: int | None, event_type: str) -> None:
 def set_user_utm_slug_if_absent(user_id: int, slug: str) -> bool:
     """First-touch атрибуция: записать utm_slug пользователю только если он ещё не задан."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "UPDATE users SET utm_slug = ? WHERE telegram_id = ? AND (utm_slug IS NULL OR utm_slug = '')",
@@ -4263,7 +4285,7 @@ def get_utm_analytics() -> list[dict]:
     """Эффективность UTM-меток (Этап 5.4): клики, регистрации, оплаты, выручка, ROI (если задан budget)."""
     result: list[dict] = []
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             links = [dict(r) for r in cursor.execute("SELECT * FROM utm_links ORDER BY created_at DESC").fetchall()]
@@ -4310,7 +4332,7 @@ def get_utm_analytics() -> list[dict]:
 
 def create_broadcast_campaign(name: str, text_html: str, interval_hours: int = 72, target_segment: str = "inactive") -> int | None:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "INSERT INTO broadcast_campaigns (name, text_html, interval_hours, target_segment) VALUES (?, ?, ?, ?)",
@@ -4325,7 +4347,7 @@ def create_broadcast_campaign(name: str, text_html: str, interval_hours: int = 7
 
 def get_broadcast_campaigns() -> list[dict]:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM broadcast_campaigns ORDER BY created_at DESC")
@@ -4337,7 +4359,7 @@ def get_broadcast_campaigns() -> list[dict]:
 
 def get_broadcast_campaign(campaign_id: int) -> dict | None:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM broadcast_campaigns WHERE id = ?", (int(campaign_id),))
@@ -4350,7 +4372,7 @@ def get_broadcast_campaign(campaign_id: int) -> dict | None:
 
 def update_broadcast_campaign(campaign_id: int, *, name: str, text_html: str, interval_hours: int) -> bool:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "UPDATE broadcast_campaigns SET name=?, text_html=?, interval_hours=?, updated_at=CURRENT_TIMESTAMP WHERE id=?",
@@ -4366,7 +4388,7 @@ def update_broadcast_campaign(campaign_id: int, *, name: str, text_html: str, in
 def toggle_broadcast_campaign(campaign_id: int) -> bool:
     """Flip is_active. Returns new is_active state."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT is_active FROM broadcast_campaigns WHERE id = ?", (int(campaign_id),))
             row = cursor.fetchone()
@@ -4386,7 +4408,7 @@ def toggle_broadcast_campaign(campaign_id: int) -> bool:
 
 def delete_broadcast_campaign(campaign_id: int) -> bool:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM broadcast_sends WHERE campaign_id = ?", (int(campaign_id),))
             cursor.execute("DELETE FROM broadcast_campaigns WHERE id = ?", (int(campaign_id),))
@@ -4418,7 +4440,7 @@ def get_inactive_subscribers() -> list[int]:
     not banned, not marked unreachable (blocked the bot / deactivated account),
     and not email-only accounts without Telegram auth."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """
@@ -4446,7 +4468,7 @@ def get_pending_broadcast_recipients(campaign_id: int, interval_hours: int) -> l
     if not inactive:
         return []
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """
@@ -4468,7 +4490,7 @@ def record_broadcast_sends(campaign_id: int, user_ids: list[int]) -> int:
     if not user_ids:
         return 0
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.executemany(
                 "INSERT INTO broadcast_sends (campaign_id, user_id) VALUES (?, ?)",
@@ -4488,7 +4510,7 @@ def record_broadcast_sends(campaign_id: int, user_ids: list[int]) -> int:
 def mark_broadcast_run(campaign_id: int) -> None:
     """Update last_run_at even when there are no recipients (avoids tight retry loops)."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "UPDATE broadcast_campaigns SET last_run_at=CURRENT_TIMESTAMP WHERE id=?",
@@ -4501,7 +4523,7 @@ def mark_broadcast_run(campaign_id: int) -> None:
 
 def get_broadcast_stats(campaign_id: int) -> dict:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT COUNT(*), MAX(sent_at) FROM broadcast_sends WHERE campaign_id = ?", (int(campaign_id),))
             row = cursor.fetchone()
@@ -4513,7 +4535,7 @@ def get_broadcast_stats(campaign_id: int) -> dict:
 
 def get_all_keys() -> list[dict]:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM vpn_keys")
@@ -4526,7 +4548,7 @@ def get_all_keys() -> list[dict]:
 def get_all_key_ids() -> list[int]:
     """Все key_id из vpn_keys (без фильтров/пагинации) — для bulk-действий «всем»."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT key_id FROM vpn_keys ORDER BY key_id ASC")
             return [int(row[0]) for row in cursor.fetchall()]
@@ -4590,7 +4612,7 @@ def get_keys_paginated(page: int = 1, per_page: int = 25, search: str | None = N
         order_sql += f", {sort_columns['created_at']} DESC"
 
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute(f"SELECT COUNT(*) FROM vpn_keys{where_sql}", params)
@@ -4645,9 +4667,101 @@ def create_gift_key(user_id: int, host_name: str, key_email: str, months: int, r
         logging.error(f"Failed to create gift key for user {user_id}: {e}")
         return None
 
-def get_setting(key: str) -> str | None:
+# =============================
+# Settings cache
+# =============================
+#
+# `bot_settings` целиком держится в памяти процесса: горячие пути (меню,
+# способы оплаты, is_admin, конфиг Remnawave) читают десятки ключей на каждый
+# апдейт. Любая запись в таблицу (через update_setting, модули или другой
+# процесс) увеличивает `bot_settings_meta.generation` триггером; кеш сверяет
+# поколение не чаще раза в SETTINGS_CACHE_CHECK_SEC и перечитывает таблицу,
+# только если оно изменилось. update_setting в этом процессе обновляет кеш сразу.
+
+SETTINGS_CACHE_CHECK_SEC = max(0.0, float(os.getenv("SHOPBOT_SETTINGS_CACHE_CHECK_SEC", "1.0") or 0))
+
+_settings_cache_lock = threading.Lock()
+# (db_path, generation, checked_at_monotonic, values)
+_settings_cache: tuple[str, int, float, dict[str, str | None]] | None = None
+
+
+def _ensure_settings_generation(cursor: sqlite3.Cursor) -> None:
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS bot_settings_meta (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            generation INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    cursor.execute("INSERT OR IGNORE INTO bot_settings_meta (id, generation) VALUES (1, 0)")
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        cursor.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_bot_settings_generation_{event.lower()}
+            AFTER {event} ON bot_settings
+            BEGIN
+                UPDATE bot_settings_meta SET generation = generation + 1 WHERE id = 1;
+            END
+            """
+        )
+
+
+def _read_settings_generation(cursor: sqlite3.Cursor) -> int | None:
+    try:
+        cursor.execute("SELECT generation FROM bot_settings_meta WHERE id = 1")
+        row = cursor.fetchone()
+        return int(row[0]) if row else None
+    except sqlite3.OperationalError:
+        # БД ещё не инициализирована (initialize_db не вызывался).
+        return None
+
+
+def _settings_snapshot() -> dict[str, str | None] | None:
+    """Актуальный снимок bot_settings или None, если кеш недоступен."""
+    global _settings_cache
+    db_path = str(DB_FILE)
+    cached = _settings_cache
+    now = time.monotonic()
+    if cached is not None and cached[0] == db_path and now - cached[2] < SETTINGS_CACHE_CHECK_SEC:
+        return cached[3]
+
+    with _settings_cache_lock:
+        cached = _settings_cache
+        if cached is not None and cached[0] == db_path and now - cached[2] < SETTINGS_CACHE_CHECK_SEC:
+            return cached[3]
+        try:
+            with _connect() as conn:
+                cursor = conn.cursor()
+                generation = _read_settings_generation(cursor)
+                if generation is None:
+                    _settings_cache = None
+                    return None
+                if cached is not None and cached[0] == db_path and cached[1] == generation:
+                    _settings_cache = (db_path, generation, now, cached[3])
+                    return cached[3]
+                cursor.execute("SELECT key, value FROM bot_settings")
+                values = {row[0]: row[1] for row in cursor.fetchall()}
+                # Таблица и поколение читаются без транзакции: если между
+                # запросами кто-то записал, поколение уже устарело и следующая
+                # проверка просто перечитает таблицу ещё раз.
+                _settings_cache = (db_path, generation, now, values)
+                return values
+        except sqlite3.Error as e:
+            logging.error(f"Failed to load settings cache: {e}")
+            return None
+
+
+def invalidate_settings_cache() -> None:
+    """Сбросить кеш настроек (после прямой записи в bot_settings в обход update_setting)."""
+    global _settings_cache
+    with _settings_cache_lock:
+        _settings_cache = None
+
+
+def _get_setting_uncached(key: str) -> str | None:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT value FROM bot_settings WHERE key = ?", (key,))
             result = cursor.fetchone()
@@ -4656,6 +4770,21 @@ def get_setting(key: str) -> str | None:
         logging.error(f"Failed to get setting '{key}': {e}")
         return None
 
+
+def get_setting(key: str) -> str | None:
+    settings = _settings_snapshot()
+    if settings is None:
+        return _get_setting_uncached(key)
+    return settings.get(key)
+
+
+def get_settings(keys) -> dict[str, str | None]:
+    """Несколько настроек за один раз: {key: value}, отсутствующие ключи — None."""
+    settings = _settings_snapshot()
+    if settings is None:
+        return {key: _get_setting_uncached(key) for key in keys}
+    return {key: settings.get(key) for key in keys}
+
 def get_admin_ids() -> set[int]:
     """Возвращает множество ID администраторов из настроек.
     Поддерживает оба варианта: одиночный 'admin_telegram_id' и список 'admin_telegram_ids'
@@ -4663,13 +4792,14 @@ def get_admin_ids() -> set[int]:
     """
     ids: set[int] = set()
     try:
-        single = get_setting("admin_telegram_id")
+        cfg = get_settings(("admin_telegram_id", "admin_telegram_ids"))
+        single = cfg["admin_telegram_id"]
         if single:
             try:
                 ids.add(int(single))
             except Exception:
                 pass
-        multi_raw = get_setting("admin_telegram_ids")
+        multi_raw = cfg["admin_telegram_ids"]
         if multi_raw:
             s = (multi_raw or "").strip()
 
@@ -4702,18 +4832,17 @@ def is_admin(user_id: int) -> bool:
     except Exception:
         return False
 
-def _connect_pending_db() -> sqlite3.Connection:
-    """Connection helper for high-contention tables (webhooks/bot)."""
-    conn = sqlite3.connect(DB_FILE, timeout=5.0, isolation_level=None)
-    conn.row_factory = sqlite3.Row
-    try:
-        cur = conn.cursor()
-        cur.execute("PRAGMA journal_mode=WAL;")
-        cur.execute("PRAGMA synchronous=NORMAL;")
-        cur.execute("PRAGMA busy_timeout=5000;")
-    except Exception:
-        pass
-    return conn
+@contextmanager
+def _connect_pending_db():
+    """Connection helper for high-contention tables (webhooks/bot).
+
+    Autocommit-соединение из пула: WAL/synchronous/busy_timeout уже применены
+    при открытии, isolation_level/row_factory сбрасываются при возврате в пул.
+    """
+    with _connect() as conn:
+        conn.isolation_level = None
+        conn.row_factory = sqlite3.Row
+        yield conn
 
 
 def _retry_sqlite(work, attempts: int = 5, base_sleep: float = 0.05):
@@ -5140,7 +5269,7 @@ def get_referrals_for_user(user_id: int) -> list[dict]:
     Поля: telegram_id, username, registration_date, total_spent.
     """
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute(
@@ -5166,7 +5295,7 @@ def get_referral_top_rich(limit: int = 5) -> list[dict]:
     Поля: telegram_id, rich_referrals.
     """
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute(
@@ -5200,7 +5329,7 @@ def get_referral_rank_and_count(user_id: int) -> tuple[int | None, int]:
       - count — количество таких рефералов у пользователя.
     """
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """
@@ -5245,9 +5374,12 @@ def get_referral_rank_and_count(user_id: int) -> tuple[int | None, int]:
         return None, 0
 
 def get_all_settings() -> dict:
+    cached = _settings_snapshot()
+    if cached is not None:
+        return dict(cached)
     settings = {}
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("SELECT key, value FROM bot_settings")
@@ -5259,14 +5391,36 @@ def get_all_settings() -> dict:
     return settings
 
 def update_setting(key: str, value: str):
+    global _settings_cache
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("INSERT OR REPLACE INTO bot_settings (key, value) VALUES (?, ?)", (key, value))
+            generation = _read_settings_generation(cursor)
             conn.commit()
             logging.info(f"Setting '{key}' updated.")
     except sqlite3.Error as e:
         logging.error(f"Failed to update setting '{key}': {e}")
+        invalidate_settings_cache()
+        return
+
+    # Write-through: если с момента загрузки кеша таблицу никто больше не
+    # менял (наша запись — ровно +1 к поколению), достаточно поправить снимок.
+    # Иначе сбрасываем кеш, чтобы подтянуть и чужие изменения.
+    db_path = str(DB_FILE)
+    with _settings_cache_lock:
+        cached = _settings_cache
+        if (
+            generation is not None
+            and cached is not None
+            and cached[0] == db_path
+            and cached[1] + 1 == generation
+        ):
+            values = dict(cached[3])
+            values[key] = value
+            _settings_cache = (db_path, generation, time.monotonic(), values)
+        else:
+            _settings_cache = None
 
 
 def get_button_configs(menu_type: str) -> list[dict]:
@@ -5276,7 +5430,7 @@ def get_button_configs(menu_type: str) -> list[dict]:
     intentionally filters by `is_active = 1`.
     """
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("""
@@ -5299,7 +5453,7 @@ def get_button_configs_admin(menu_type: str, *, include_inactive: bool = True) -
     admins can re-enable them.
     """
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             if include_inactive:
@@ -5329,7 +5483,7 @@ def get_button_configs_admin(menu_type: str, *, include_inactive: bool = True) -
 def get_button_config_by_db_id(button_db_id: int) -> dict | None:
     """Get a button configuration by its numeric DB id."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM button_configs WHERE id = ?", (button_db_id,))
@@ -5342,7 +5496,7 @@ def get_button_config_by_db_id(button_db_id: int) -> dict | None:
 def get_button_config(menu_type: str, button_id: str) -> dict | None:
     """Get a specific button configuration by menu_type and button_id"""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("""
@@ -5372,7 +5526,7 @@ def create_button_config(
 ) -> bool:
     """Create a new button configuration"""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             active_val = 1 if bool(is_active) else 0
             cursor.execute(
@@ -5409,7 +5563,7 @@ def update_button_config(button_id: int, text: str = None, callback_data: str =
     try:
         logging.info(f"update_button_config called for {button_id}: text={text}, callback_data={callback_data}, url={url}, row={row_position}, col={column_position}, active={is_active}, sort={sort_order}")
         
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             
 
@@ -5468,7 +5622,7 @@ def update_button_config(button_id: int, text: str = None, callback_data: str =
 def delete_button_config(button_id: int) -> bool:
     """Delete a button configuration"""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM button_configs WHERE id = ?", (button_id,))
             conn.commit()
@@ -5481,7 +5635,7 @@ def delete_button_config(button_id: int) -> bool:
 def update_existing_my_keys_button():
     """Update existing my_keys button to include key count template and set proper button widths"""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
 
             cursor.execute("""
@@ -5516,7 +5670,7 @@ def update_existing_my_keys_button():
 def ensure_main_menu_gift_button() -> None:
     """Ensure that the main menu has the gift button in button configs."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
 
             cursor.execute(
@@ -5555,7 +5709,7 @@ def ensure_main_menu_referral_button() -> None:
     and that it's removed from the profile menu (moved from "Мой профиль" в главное меню).
     """
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
 
             # Убираем кнопку из меню "Мой профиль" (перенесена в главное меню)
@@ -5610,7 +5764,7 @@ def ensure_admin_plans_button():
     runs only when button_configs is empty.
     """
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
 
             cursor.execute(
@@ -5685,7 +5839,7 @@ def ensure_admin_trial_button():
     runs only when button_configs is empty.
     """
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
 
             cursor.execute(
@@ -5731,7 +5885,7 @@ def ensure_admin_auto_renew_button():
     existing customization of this button.
     """
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
 
             cursor.execute(
@@ -5770,7 +5924,7 @@ def reorder_button_configs(menu_type: str, button_orders: list[dict]) -> bool:
     """Reorder button configurations for a menu type"""
     try:
         logging.info(f"Reordering {len(button_orders)} buttons for {menu_type}")
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             for order_data in button_orders:
                 button_id = order_data.get('button_id')
@@ -5817,7 +5971,7 @@ def reorder_button_configs(menu_type: str, button_orders: list[dict]) -> bool:
 def initialize_default_button_configs():
     """Initialize default button configurations for all menu types"""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             
 
@@ -5963,7 +6117,7 @@ def create_plan(host_name: str, plan_name: str, months: int | None, price: float
         # 'MONTH_ROLLING' — трафик сбрасывается ежемесячно, отсчитывая от даты создания ключа (rolling-цикл),
         # в отличие от 'MONTH', который сбрасывает трафик по календарным месяцам.
         traffic_limit_strategy = 'MONTH_ROLLING' if traffic_limit_bytes > 0 else None
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "INSERT INTO plans (host_name, plan_name, months, duration_days, price, traffic_limit_bytes, traffic_limit_strategy, hwid_device_limit, lte_limit_bytes, main_reset_price_rub) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
@@ -5978,7 +6132,7 @@ def create_plan(host_name: str, plan_name: str, months: int | None, price: float
 def get_plans_for_host(host_name: str) -> list[dict]:
     try:
         host_name = normalize_host_name(host_name)
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM plans WHERE TRIM(host_name) = TRIM(?) ORDER BY sort_order, COALESCE(duration_days, months*30, months, 0)", (host_name,))
@@ -5994,7 +6148,7 @@ def get_active_plans_for_host(host_name: str) -> list[dict]:
     """Возвращает только активные тарифы (is_active = 1) для указанного хоста."""
     try:
         host_name = normalize_host_name(host_name)
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute(
@@ -6011,7 +6165,7 @@ def get_active_plans_for_host(host_name: str) -> list[dict]:
 def set_plan_active(plan_id: int, is_active: bool) -> bool:
     """Включить/выключить тариф (скрыть/показать пользователям)."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "UPDATE plans SET is_active = ? WHERE plan_id = ?",
@@ -6025,7 +6179,7 @@ def set_plan_active(plan_id: int, is_active: bool) -> bool:
 
 def get_plan_by_id(plan_id: int) -> dict | None:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM plans WHERE plan_id = ?", (plan_id,))
@@ -6039,7 +6193,7 @@ def get_plan_by_id(plan_id: int) -> dict | None:
 def get_all_plans() -> list[dict]:
     """Все тарифы (для админки промокодов и валидации applicable_plan_ids)."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute(
@@ -6072,7 +6226,7 @@ def update_plan_metadata(plan_id: int, metadata: dict | None) -> bool:
         raw = None
         if metadata:
             raw = json.dumps(metadata, ensure_ascii=False)
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("UPDATE plans SET metadata = ? WHERE plan_id = ?", (raw, int(plan_id)))
             conn.commit()
@@ -6095,7 +6249,7 @@ def create_traffic_package(plan_id: int, size_gb: float, price: float, pool: str
     """
     pool = 'lte' if str(pool).strip().lower() == 'lte' else 'main'
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "SELECT COALESCE(MAX(sort_order), 0) FROM traffic_packages WHERE plan_id = ? AND COALESCE(pool, 'main') = ?",
@@ -6116,7 +6270,7 @@ def create_traffic_package(plan_id: int, size_gb: float, price: float, pool: str
 def get_traffic_packages_for_plan(plan_id: int, only_active: bool = False, pool: str = 'main') -> list[dict]:
     pool = 'lte' if str(pool).strip().lower() == 'lte' else 'main'
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             query = "SELECT * FROM traffic_packages WHERE plan_id = ? AND COALESCE(pool, 'main') = ?"
@@ -6132,7 +6286,7 @@ def get_traffic_packages_for_plan(plan_id: int, only_active: bool = False, pool:
 
 def get_traffic_package_by_id(package_id: int) -> dict | None:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM traffic_packages WHERE package_id = ?", (int(package_id),))
@@ -6156,7 +6310,7 @@ def update_traffic_package(package_id: int, *, size_gb: float | None = None, pri
     try:
         set_clause = ", ".join([f"{k} = ?" for k in fields.keys()])
         values = list(fields.values()) + [int(package_id)]
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(f"UPDATE traffic_packages SET {set_clause} WHERE package_id = ?", values)
             conn.commit()
@@ -6168,7 +6322,7 @@ def update_traffic_package(package_id: int, *, size_gb: float | None = None, pri
 
 def delete_traffic_package(package_id: int) -> bool:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM traffic_packages WHERE package_id = ?", (int(package_id),))
             conn.commit()
@@ -6180,7 +6334,7 @@ def delete_traffic_package(package_id: int) -> bool:
 
 def set_key_traffic_boost(key_id: int, boost_bytes: int) -> bool:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "UPDATE vpn_keys SET traffic_boost_bytes = ? WHERE key_id = ?",
@@ -6195,7 +6349,7 @@ def set_key_traffic_boost(key_id: int, boost_bytes: int) -> bool:
 
 def get_plan_lte_limit(plan_id: int) -> int:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT lte_limit_bytes FROM plans WHERE plan_id = ?", (int(plan_id),))
             row = cursor.fetchone()
@@ -6214,7 +6368,7 @@ def get_lte_state(user_id: int) -> dict:
     миграцией `_migrate_subscription_lte_to_keys`, и в рантайме не используются.
     """
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM subscription_lte WHERE user_id = ?", (int(user_id),))
@@ -6278,7 +6432,7 @@ def get_key_lte_state(key_id: int) -> dict:
     мгновенного исчерпания лимита накопленной историей нод.
     """
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM key_lte_state WHERE key_id = ?", (int(key_id),))
@@ -6328,7 +6482,7 @@ def update_key_lte_state(
     fields["updated_at"] = _now_str()
     try:
         set_clause = ", ".join(f"{k} = ?" for k in fields)
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 f"UPDATE key_lte_state SET {set_clause} WHERE key_id = ?",
@@ -6351,7 +6505,7 @@ def add_key_lte_boost_bytes(key_id: int, add_bytes: int) -> int | None:
         return None
     get_key_lte_state(key_id)  # ensure row exists
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("BEGIN IMMEDIATE")
             cursor.execute(
@@ -6390,7 +6544,7 @@ def commit_key_lte_baseline(key_id: int, baseline_bytes: int, *, expire_boost: b
     if expire_boost:
         sets.append("lte_boost_bytes = 0")
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("BEGIN IMMEDIATE")
             cursor.execute(
@@ -6408,7 +6562,7 @@ def request_key_lte_baseline_reset(key_id: int) -> bool:
     """Пометить начало нового расчётного периода LTE у ключа (буст сгорит вместе с baseline)."""
     get_key_lte_state(key_id)  # ensure row exists
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "UPDATE key_lte_state SET lte_baseline_reset_requested = 1, updated_at = ? WHERE key_id = ?",
@@ -6459,7 +6613,7 @@ def add_lte_boost_bytes(user_id: int, add_bytes: int) -> int | None:
         return None
     get_lte_state(user_id)  # ensure row exists
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("BEGIN IMMEDIATE")
             cursor.execute(
@@ -6506,7 +6660,7 @@ def commit_lte_baseline(user_id: int, baseline_bytes: int, *, expire_boost: bool
     if expire_boost:
         sets.append("lte_boost_bytes = 0")
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("BEGIN IMMEDIATE")
             cursor.execute(
@@ -6533,7 +6687,7 @@ def request_lte_baseline_reset(user_id: int) -> bool:
     """
     get_lte_state(user_id)  # ensure row exists
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "UPDATE subscription_lte SET lte_baseline_reset_requested = 1, updated_at = ? WHERE user_id = ?",
@@ -6579,7 +6733,7 @@ def update_lte_state(
     try:
         set_clause = ", ".join([f"{k} = ?" for k in fields.keys()])
         values = list(fields.values()) + [int(user_id)]
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(f"UPDATE subscription_lte SET {set_clause} WHERE user_id = ?", values)
             conn.commit()
@@ -6591,7 +6745,7 @@ def update_lte_state(
 
 def delete_plan(plan_id: int) -> None:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM traffic_packages WHERE plan_id = ?", (plan_id,))
             cursor.execute("DELETE FROM plans WHERE plan_id = ?", (plan_id,))
@@ -6625,7 +6779,7 @@ def update_plan(plan_id: int, plan_name: str, months: int | None, price: float,
         set_clause = ", ".join([f"{k} = ?" for k in fields.keys()])
         values = list(fields.values()) + [plan_id]
 
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(f"UPDATE plans SET {set_clause} WHERE plan_id = ?", values)
             conn.commit()
@@ -6647,7 +6801,7 @@ def register_user_if_not_exists(telegram_id: int, username: str, referrer_id):
     ``/start ref_<id>`` мог привязать аккаунт, у которого поле ещё пустое.
     """
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT referred_by FROM users WHERE telegram_id = ?", (telegram_id,))
             row = cursor.fetchone()
@@ -6666,7 +6820,7 @@ def register_user_if_not_exists(telegram_id: int, username: str, referrer_id):
 
 def add_to_referral_balance(user_id: int, amount: float) -> bool:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("UPDATE users SET referral_balance = referral_balance + ? WHERE telegram_id = ?", (amount, user_id))
             conn.commit()
@@ -6677,7 +6831,7 @@ def add_to_referral_balance(user_id: int, amount: float) -> bool:
 
 def set_referral_balance(user_id: int, value: float):
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("UPDATE users SET referral_balance = ? WHERE telegram_id = ?", (value, user_id))
             conn.commit()
@@ -6686,7 +6840,7 @@ def set_referral_balance(user_id: int, value: float):
 
 def set_referral_balance_all(user_id: int, value: float):
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("UPDATE users SET referral_balance_all = ? WHERE telegram_id = ?", (value, user_id))
             conn.commit()
@@ -6695,7 +6849,7 @@ def set_referral_balance_all(user_id: int, value: float):
 
 def add_to_referral_balance_all(user_id: int, amount: float):
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "UPDATE users SET referral_balance_all = referral_balance_all + ? WHERE telegram_id = ?",
@@ -6707,7 +6861,7 @@ def add_to_referral_balance_all(user_id: int, amount: float):
 
 def get_referral_balance_all(user_id: int) -> float:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT referral_balance_all FROM users WHERE telegram_id = ?", (user_id,))
             row = cursor.fetchone()
@@ -6718,7 +6872,7 @@ def get_referral_balance_all(user_id: int) -> float:
 
 def get_referral_balance(user_id: int) -> float:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT referral_balance FROM users WHERE telegram_id = ?", (user_id,))
             result = cursor.fetchone()
@@ -6729,7 +6883,7 @@ def get_referral_balance(user_id: int) -> float:
 
 def get_balance(user_id: int) -> float:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT balance FROM users WHERE telegram_id = ?", (user_id,))
             result = cursor.fetchone()
@@ -6741,7 +6895,7 @@ def get_balance(user_id: int) -> float:
 def adjust_user_balance(user_id: int, delta: float) -> bool:
     """Скорректировать баланс пользователя на указанную дельту (может быть отрицательной)."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("UPDATE users SET balance = COALESCE(balance, 0) + ? WHERE telegram_id = ?", (float(delta), user_id))
             conn.commit()
@@ -6753,7 +6907,7 @@ def adjust_user_balance(user_id: int, delta: float) -> bool:
 def adjust_user_referral_balance(user_id: int, delta: float) -> bool:
     """Скорректировать реферальный баланс пользователя на указанную дельту (может быть отрицательной)."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("UPDATE users SET referral_balance = COALESCE(referral_balance, 0) + ? WHERE telegram_id = ?", (float(delta), user_id))
             conn.commit()
@@ -6764,7 +6918,7 @@ def adjust_user_referral_balance(user_id: int, delta: float) -> bool:
 
 def set_balance(user_id: int, value: float) -> bool:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("UPDATE users SET balance = ? WHERE telegram_id = ?", (value, user_id))
             conn.commit()
@@ -6776,7 +6930,7 @@ def set_balance(user_id: int, value: float) -> bool:
 def add_to_balance(user_id: int, amount: float) -> bool:
     try:
         logging.info(f"💳 Добавляем {amount:.2f} RUB к балансу пользователя {user_id}")
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
 
             cursor.execute("SELECT telegram_id, balance FROM users WHERE telegram_id = ?", (int(user_id),))
@@ -6807,7 +6961,7 @@ def deduct_from_balance(user_id: int, amount: float) -> bool:
     if amount <= 0:
         return True
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("BEGIN IMMEDIATE")
             cursor.execute("SELECT balance FROM users WHERE telegram_id = ?", (user_id,))
@@ -6831,7 +6985,7 @@ def deduct_from_referral_balance(user_id: int, amount: float) -> bool:
     if amount <= 0:
         return True
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("BEGIN IMMEDIATE")
             cursor.execute("SELECT referral_balance FROM users WHERE telegram_id = ?", (user_id,))
@@ -6932,7 +7086,7 @@ def format_referral_withdrawal_admin_notice(
 
 def list_referral_payout_methods(user_id: int) -> list[dict]:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cur = conn.cursor()
             cur.execute(
@@ -6954,7 +7108,7 @@ def add_referral_payout_method(user_id: int, method_type: str, requisite_value:
     if not ok:
         return False, msg, None
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             cur.execute(
                 "INSERT INTO referral_payout_methods (user_id, method_type, bank_name, requisite_value) VALUES (?, ?, ?, ?)",
@@ -6969,7 +7123,7 @@ def add_referral_payout_method(user_id: int, method_type: str, requisite_value:
 
 def delete_referral_payout_method(method_id: int, user_id: int) -> tuple[bool, str]:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             cur.execute(
                 "DELETE FROM referral_payout_methods WHERE id = ? AND user_id = ?",
@@ -6986,7 +7140,7 @@ def delete_referral_payout_method(method_id: int, user_id: int) -> tuple[bool, s
 
 def get_referral_payout_method(method_id: int, user_id: int | None = None) -> dict | None:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cur = conn.cursor()
             if user_id is not None:
@@ -7006,7 +7160,7 @@ def get_referral_payout_method(method_id: int, user_id: int | None = None) -> di
 def create_webapp_auth_request(token: str) -> bool:
     """Создаёт запись ожидания подтверждения входа через deep-link бота (user_id пока NULL)."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "INSERT OR REPLACE INTO webapp_auth_requests (token, user_id, created_at) VALUES (?, NULL, CURRENT_TIMESTAMP)",
@@ -7022,7 +7176,7 @@ def create_webapp_auth_request(token: str) -> bool:
 def confirm_webapp_auth_request(token: str, user_id: int) -> bool:
     """Подтверждает вход: бот вызывает эту функцию после получения deep-link auth_{token}."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT token FROM webapp_auth_requests WHERE token = ?", (str(token),))
             if not cursor.fetchone():
@@ -7044,7 +7198,7 @@ def get_webapp_auth_request(token: str, *, consume: bool = False) -> int | None:
     Если consume=True и запрос подтверждён, удаляет запись (одноразовое использование).
     """
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT user_id FROM webapp_auth_requests WHERE token = ?", (str(token),))
             row = cursor.fetchone()
@@ -7062,7 +7216,7 @@ def get_webapp_auth_request(token: str, *, consume: bool = False) -> int | None:
 
 def cleanup_old_webapp_auth_requests(max_age_minutes: int = 30) -> None:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "DELETE FROM webapp_auth_requests WHERE created_at < datetime('now', ?)",
@@ -7097,7 +7251,7 @@ def create_referral_withdrawal_request(user_id: int, amount: float, method_id: i
     if not is_referral_withdraw_method_type_enabled(method_type):
         return False, "Этот способ получения временно недоступен.", None
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("BEGIN IMMEDIATE")
             cursor.execute(
@@ -7139,7 +7293,7 @@ def create_referral_withdrawal_request(user_id: int, amount: float, method_id: i
 def has_open_referral_withdrawal_request(user_id: int) -> bool:
     """Есть ли у пользователя незакрытая заявка (new/processing)."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             cur.execute(
                 """
@@ -7157,7 +7311,7 @@ def has_open_referral_withdrawal_request(user_id: int) -> bool:
 
 def list_referral_withdrawal_requests(status: str | None = None, user_id: int | None = None) -> list[dict]:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cur = conn.cursor()
             query = """
@@ -7185,7 +7339,7 @@ def list_referral_withdrawal_requests(status: str | None = None, user_id: int |
 
 def get_referral_withdrawal_request(request_id: int) -> dict | None:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cur = conn.cursor()
             cur.execute(
@@ -7218,7 +7372,7 @@ def update_referral_withdrawal_request_status(request_id: int, new_status: str,
     if new_status not in REFERRAL_WITHDRAWAL_STATUSES:
         return False, "Некорректный статус.", None
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("BEGIN IMMEDIATE")
             cursor.execute("SELECT * FROM referral_withdrawal_requests WHERE id = ?", (int(request_id),))
@@ -7288,7 +7442,7 @@ def get_referral_withdrawable_stats() -> dict:
     """Сводка по заявкам на вывод (для админ-панели): счётчики по статусам и суммы."""
     out = {"new": 0, "processing": 0, "paid": 0, "rejected": 0, "new_amount": 0.0, "processing_amount": 0.0, "paid_amount": 0.0}
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             cur.execute("SELECT status, COUNT(*), COALESCE(SUM(amount),0) FROM referral_withdrawal_requests GROUP BY status")
             for status, cnt, amt in cur.fetchall() or []:
@@ -7302,7 +7456,7 @@ def get_referral_withdrawable_stats() -> dict:
 
 def get_referral_count(user_id: int) -> int:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT COUNT(*) FROM users WHERE referred_by = ?", (user_id,))
             return cursor.fetchone()[0] or 0
@@ -7312,7 +7466,7 @@ def get_referral_count(user_id: int) -> int:
 
 def get_user(telegram_id: int):
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM users WHERE telegram_id = ?", (telegram_id,))
@@ -7329,7 +7483,7 @@ def get_user_by_username(username: str):
         uname = (username or "").lstrip("@").strip()
         if not uname:
             return None
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cur = conn.cursor()
             cur.execute("SELECT * FROM users WHERE LOWER(username) = LOWER(?) LIMIT 1", (uname,))
@@ -7341,7 +7495,7 @@ def get_user_by_username(username: str):
 
 def set_terms_agreed(telegram_id: int):
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("UPDATE users SET agreed_to_terms = 1 WHERE telegram_id = ?", (telegram_id,))
             conn.commit()
@@ -7352,7 +7506,7 @@ def set_terms_agreed(telegram_id: int):
 def is_subscription_expiry_notifications_enabled(telegram_id: int) -> bool:
     """Проверить, включены ли уведомления об истечении срока ключа."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "SELECT subscription_expiry_notifications_enabled FROM users WHERE telegram_id = ?",
@@ -7369,7 +7523,7 @@ def is_subscription_expiry_notifications_enabled(telegram_id: int) -> bool:
 def toggle_subscription_expiry_notifications(telegram_id: int) -> bool:
     """Переключить статус уведомлений об истечении срока. Возвращает новое состояние."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             # Получаем текущее состояние
             cursor.execute(
@@ -7394,7 +7548,7 @@ def toggle_subscription_expiry_notifications(telegram_id: int) -> bool:
 
 def update_user_stats(telegram_id: int, amount_spent: float, months_purchased: int):
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("UPDATE users SET total_spent = total_spent + ?, total_months = total_months + ? WHERE telegram_id = ?", (amount_spent, months_purchased, telegram_id))
             conn.commit()
@@ -7403,7 +7557,7 @@ def update_user_stats(telegram_id: int, amount_spent: float, months_purchased: i
 
 def get_user_count() -> int:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT COUNT(*) FROM users")
             return cursor.fetchone()[0] or 0
@@ -7413,7 +7567,7 @@ def get_user_count() -> int:
 
 def get_total_keys_count() -> int:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT COUNT(*) FROM vpn_keys")
             return cursor.fetchone()[0] or 0
@@ -7423,7 +7577,7 @@ def get_total_keys_count() -> int:
 
 def get_total_spent_sum() -> float:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
 
             cursor.execute(
@@ -7449,14 +7603,8 @@ def create_pending_transaction(payment_id: str, user_id: int, amount_rub: float,
     if not pid:
         return 0
     try:
-        with sqlite3.connect(DB_FILE, timeout=5.0) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
-            try:
-                cursor.execute("PRAGMA journal_mode=WAL;")
-                cursor.execute("PRAGMA synchronous=NORMAL;")
-                cursor.execute("PRAGMA busy_timeout=5000;")
-            except Exception:
-                pass
 
             cursor.execute(
                 "INSERT OR IGNORE INTO transactions (payment_id, user_id, status, amount_rub, metadata) VALUES (?, ?, ?, ?, ?)",
@@ -7481,15 +7629,10 @@ def find_and_complete_ton_transaction(payment_id: str, amount_ton: float) -> dic
         return None
 
     try:
-        with sqlite3.connect(DB_FILE, timeout=5.0, isolation_level=None) as conn:
+        with _connect() as conn:
+            conn.isolation_level = None
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
-            try:
-                cursor.execute("PRAGMA journal_mode=WAL;")
-                cursor.execute("PRAGMA synchronous=NORMAL;")
-                cursor.execute("PRAGMA busy_timeout=5000;")
-            except Exception:
-                pass
 
             cursor.execute("BEGIN IMMEDIATE")
             cursor.execute("SELECT metadata FROM transactions WHERE payment_id = ? AND status = 'pending'", (pid,))
@@ -7672,7 +7815,7 @@ def get_paginated_transactions(page: int = 1, per_page: int = 15) -> tuple[list[
     transactions = []
     total = 0
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             
@@ -7766,7 +7909,7 @@ def get_transactions_paginated(
     transactions: list = []
     total = 0
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
 
@@ -7818,7 +7961,7 @@ def get_transactions_paginated(
 
 def set_trial_used(telegram_id: int):
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("UPDATE users SET trial_used = 1 WHERE telegram_id = ?", (telegram_id,))
             conn.commit()
@@ -7847,7 +7990,7 @@ def add_new_key(
     created_str = _now_str()
     strategy_value = traffic_limit_strategy or "NO_RESET"
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """
@@ -7910,7 +8053,7 @@ def _apply_key_updates(key_id: int, updates: dict[str, Any]) -> bool:
     values = list(updates.values())
     values.append(key_id)
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 f"UPDATE vpn_keys SET {columns} WHERE key_id = ?",
@@ -8072,7 +8215,7 @@ def backfill_monthly_traffic_reset_for_existing_keys() -> int:
 def delete_key_by_email(email: str) -> bool:
     lookup = _normalize_email(email) or email.strip()
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             # Как и в delete_key_by_id: удаляем связанный неактивированный подарок,
             # чтобы он пропал из списка так же, как исчезает обычный просроченный ключ.
@@ -8109,7 +8252,7 @@ def delete_key_by_email(email: str) -> bool:
 
 def get_user_keys(user_id: int) -> list[dict]:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute(
@@ -8125,7 +8268,7 @@ def get_user_keys(user_id: int) -> list[dict]:
 
 def get_key_by_id(key_id: int) -> dict | None:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM vpn_keys WHERE key_id = ?", (key_id,))
@@ -8139,7 +8282,7 @@ def get_key_by_id(key_id: int) -> dict | None:
 def get_key_by_email(key_email: str) -> dict | None:
     lookup = _normalize_email(key_email) or key_email.strip()
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute(
@@ -8158,7 +8301,7 @@ def get_key_by_remnawave_uuid(remnawave_uuid: str) -> dict | None:
         return None
     try:
         normalized_uuid = remnawave_uuid.strip()
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute(
@@ -8204,7 +8347,7 @@ def get_next_key_number(user_id: int) -> int:
 def get_keys_for_host(host_name: str) -> list[dict]:
     try:
         host_name_normalized = normalize_host_name(host_name)
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute(
@@ -8220,7 +8363,7 @@ def get_keys_for_host(host_name: str) -> list[dict]:
 
 def set_key_auto_renew(key_id: int, enabled: bool) -> bool:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("UPDATE vpn_keys SET auto_renew = ? WHERE key_id = ?", (1 if enabled else 0, int(key_id)))
             conn.commit()
@@ -8233,7 +8376,7 @@ def set_key_auto_renew(key_id: int, enabled: bool) -> bool:
 def set_all_keys_auto_renew_for_user(user_id: int, enabled: bool) -> int:
     """Mass-update auto_renew for all keys of a user. Returns count of updated rows."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("UPDATE vpn_keys SET auto_renew = ? WHERE user_id = ?", (1 if enabled else 0, int(user_id)))
             conn.commit()
@@ -8248,7 +8391,7 @@ def get_keys_for_auto_renew(hours_before: int = 24) -> list[dict]:
     now = datetime.now()
     deadline = now + timedelta(hours=int(hours_before))
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute(
@@ -8287,7 +8430,7 @@ def search_user_keys_by_email(user_id: int, search_query: str) -> list[dict]:
 
     try:
         needle_lower = search_query.strip().lower()
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute(
@@ -8309,7 +8452,7 @@ def search_all_keys_by_email(search_query: str) -> list[dict]:
 
     try:
         needle_lower = search_query.strip().lower()
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute(
@@ -8325,7 +8468,7 @@ def search_all_keys_by_email(search_query: str) -> list[dict]:
 
 def get_all_vpn_users() -> list[dict]:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("SELECT DISTINCT user_id FROM vpn_keys")
@@ -8382,7 +8525,7 @@ def update_key_status_from_server(key_email: str, client_data) -> bool:
 def get_daily_stats_for_charts(days: int = 30) -> dict:
     stats = {'users': {}, 'keys': {}}
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """
@@ -8417,7 +8560,7 @@ def get_daily_stats_for_charts(days: int = 30) -> dict:
 def get_recent_transactions(limit: int = 15) -> list[dict]:
     transactions: list[dict] = []
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute(
@@ -8452,7 +8595,7 @@ def get_recent_transactions(limit: int = 15) -> list[dict]:
 
 def get_all_users() -> list[dict]:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM users ORDER BY registration_date DESC")
@@ -8507,7 +8650,7 @@ def get_users_paginated(
     elif sort_key in ("username_asc",):
         order_by = "LOWER(COALESCE(u.username, '')) ASC, u.registration_date DESC"
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             if q:
@@ -8586,7 +8729,7 @@ def get_keys_counts_for_users(user_ids: list[int]) -> dict[int, int]:
         return result
 
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             placeholders = ",".join(["?"] * len(user_ids))
             query = f"SELECT user_id, COUNT(*) AS cnt FROM vpn_keys WHERE user_id IN ({placeholders}) GROUP BY user_id"
@@ -8601,7 +8744,7 @@ def get_keys_counts_for_users(user_ids: list[int]) -> dict[int, int]:
 
 def ban_user(telegram_id: int):
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("UPDATE users SET is_banned = 1 WHERE telegram_id = ?", (telegram_id,))
             conn.commit()
@@ -8610,7 +8753,7 @@ def ban_user(telegram_id: int):
 
 def unban_user(telegram_id: int):
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("UPDATE users SET is_banned = 0 WHERE telegram_id = ?", (telegram_id,))
             conn.commit()
@@ -8635,7 +8778,7 @@ def mark_user_unreachable(telegram_id: int, reason: str) -> bool:
     (см. mark_user_reachable — вызывается автоматически при любом входящем сообщении/callback).
     """
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """
@@ -8657,7 +8800,7 @@ def mark_user_reachable(telegram_id: int) -> bool:
     """Снять отметку недоступности — пользователь снова взаимодействовал с ботом
     (значит, разблокировал его или его аккаунт снова активен)."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """
@@ -8678,7 +8821,7 @@ def get_reachability_stats() -> dict:
     пользователей, сколько реально доступны (не забанены и не недоступны),
     сколько заблокировали бота, сколько деактивировали аккаунт."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """
@@ -8706,7 +8849,7 @@ def get_reachability_stats() -> dict:
 
 def delete_user_keys(user_id: int):
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """
@@ -8728,7 +8871,7 @@ def delete_user_completely(user_id: int) -> bool:
     :return: True при успешном удалении, False при ошибке.
     """
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
 
             # Сначала удалить сообщения поддержки по тикетам пользователя
@@ -8837,7 +8980,7 @@ def delete_user_completely(user_id: int) -> bool:
 
 def create_support_ticket(user_id: int, subject: str | None = None) -> int | None:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
 
             try:
@@ -8866,7 +9009,7 @@ def get_or_create_open_ticket(user_id: int, subject: str | None = None) -> tuple
     Если открытого тикета нет — создаёт новый и возвращает (id, True).
     """
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
 
             cursor.execute(
@@ -8889,7 +9032,7 @@ def get_or_create_open_ticket(user_id: int, subject: str | None = None) -> tuple
 
 def add_support_message(ticket_id: int, sender: str, content: str) -> int | None:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "INSERT INTO support_messages (ticket_id, sender, content) VALUES (?, ?, ?)",
@@ -8907,7 +9050,7 @@ def add_support_message(ticket_id: int, sender: str, content: str) -> int | None
 
 def update_ticket_thread_info(ticket_id: int, forum_chat_id: str | None, message_thread_id: int | None) -> bool:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "UPDATE support_tickets SET forum_chat_id = ?, message_thread_id = ?, updated_at = CURRENT_TIMESTAMP WHERE ticket_id = ?",
@@ -8921,7 +9064,7 @@ def update_ticket_thread_info(ticket_id: int, forum_chat_id: str | None, message
 
 def get_ticket(ticket_id: int) -> dict | None:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM support_tickets WHERE ticket_id = ?", (ticket_id,))
@@ -8933,7 +9076,7 @@ def get_ticket(ticket_id: int) -> dict | None:
 
 def get_ticket_by_thread(forum_chat_id: str, message_thread_id: int) -> dict | None:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute(
@@ -8948,7 +9091,7 @@ def get_ticket_by_thread(forum_chat_id: str, message_thread_id: int) -> dict | N
 
 def get_user_tickets(user_id: int, status: str | None = None) -> list[dict]:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             if status:
@@ -8968,7 +9111,7 @@ def get_user_tickets(user_id: int, status: str | None = None) -> list[dict]:
 
 def get_ticket_messages(ticket_id: int) -> list[dict]:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             cursor.execute(
@@ -8982,7 +9125,7 @@ def get_ticket_messages(ticket_id: int) -> list[dict]:
 
 def set_ticket_status(ticket_id: int, status: str) -> bool:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "UPDATE support_tickets SET status = ?, updated_at = CURRENT_TIMESTAMP WHERE ticket_id = ?",
@@ -8996,7 +9139,7 @@ def set_ticket_status(ticket_id: int, status: str) -> bool:
 
 def update_ticket_subject(ticket_id: int, subject: str) -> bool:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "UPDATE support_tickets SET subject = ?, updated_at = CURRENT_TIMESTAMP WHERE ticket_id = ?",
@@ -9010,7 +9153,7 @@ def update_ticket_subject(ticket_id: int, subject: str) -> bool:
 
 def delete_ticket(ticket_id: int) -> bool:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "DELETE FROM support_messages WHERE ticket_id = ?",
@@ -9029,7 +9172,7 @@ def delete_ticket(ticket_id: int) -> bool:
 def get_tickets_paginated(page: int = 1, per_page: int = 20, status: str | None = None) -> tuple[list[dict], int]:
     offset = (page - 1) * per_page
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cursor = conn.cursor()
             if status:
@@ -9053,7 +9196,7 @@ def get_tickets_paginated(page: int = 1, per_page: int = 20, status: str | None
 
 def get_open_tickets_count() -> int:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT COUNT(*) FROM support_tickets WHERE status = 'open'")
             return cursor.fetchone()[0] or 0
@@ -9063,7 +9206,7 @@ def get_open_tickets_count() -> int:
 
 def get_closed_tickets_count() -> int:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT COUNT(*) FROM support_tickets WHERE status = 'closed'")
             return cursor.fetchone()[0] or 0
@@ -9073,7 +9216,7 @@ def get_closed_tickets_count() -> int:
 
 def get_all_tickets_count() -> int:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT COUNT(*) FROM support_tickets")
             return cursor.fetchone()[0] or 0
@@ -9089,7 +9232,7 @@ def get_all_tickets_count() -> int:
 
 def get_key_usage_monitor(key_id: int) -> dict | None:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cur = conn.cursor()
             cur.execute("SELECT * FROM key_usage_monitor WHERE key_id = ?", (key_id,))
@@ -9102,7 +9245,7 @@ def get_key_usage_monitor(key_id: int) -> dict | None:
 
 def ensure_key_usage_monitor_row(key_id: int, user_id: int) -> None:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             cur.execute(
                 "INSERT OR IGNORE INTO key_usage_monitor(key_id, user_id) VALUES(?, ?)",
@@ -9155,7 +9298,7 @@ def update_key_usage_monitor(
     sql = "UPDATE key_usage_monitor SET " + ", ".join(fields) + " WHERE key_id = ?"
 
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             cur.execute(sql, values)
             conn.commit()
@@ -9202,7 +9345,7 @@ def resolve_factory_bot_id(telegram_bot_user_id: int | None) -> int:
     if tg_id <= 0:
         return 0
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             cur.execute("SELECT id FROM managed_bots WHERE telegram_bot_user_id = ? AND COALESCE(is_active,1)=1 LIMIT 1", (tg_id,))
             row = cur.fetchone()
@@ -9285,7 +9428,7 @@ def _row_with_decrypted_token(row: dict | None) -> dict | None:
 
 def get_managed_bot(bot_id: int) -> dict | None:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cur = conn.cursor()
             cur.execute("SELECT * FROM managed_bots WHERE id = ? LIMIT 1", (int(bot_id),))
@@ -9298,7 +9441,7 @@ def get_managed_bot(bot_id: int) -> dict | None:
 
 def get_managed_bot_by_telegram_id(telegram_bot_user_id: int) -> dict | None:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cur = conn.cursor()
             cur.execute("SELECT * FROM managed_bots WHERE telegram_bot_user_id = ? LIMIT 1", (int(telegram_bot_user_id),))
@@ -9311,7 +9454,7 @@ def get_managed_bot_by_telegram_id(telegram_bot_user_id: int) -> dict | None:
 
 def list_active_managed_bots() -> list[dict]:
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cur = conn.cursor()
             cur.execute("SELECT * FROM managed_bots WHERE COALESCE(is_active,1)=1 ORDER BY id ASC")
@@ -9329,7 +9472,7 @@ def update_managed_bot_active(bot_id: int, is_active: int) -> bool:
     except Exception:
         return False
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             cur.execute("UPDATE managed_bots SET is_active = ? WHERE id = ?", (active, bid))
             conn.commit()
@@ -9346,7 +9489,7 @@ def get_managed_bots_by_owner(owner_telegram_id: int) -> list[dict]:
     except Exception:
         return []
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cur = conn.cursor()
             cur.execute(
@@ -9372,7 +9515,7 @@ def purge_managed_bot_stats(bot_id: int) -> None:
     except Exception:
         return
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             _purge_managed_bot_stats_on_cursor(cur, bid)
             conn.commit()
@@ -9407,7 +9550,7 @@ def delete_managed_bot(bot_id: int, owner_telegram_id: int | None = None) -> boo
         if owner_id <= 0:
             return False
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             if owner_id is None:
                 cur.execute("SELECT id FROM managed_bots WHERE id = ? LIMIT 1", (bid,))
@@ -9455,7 +9598,7 @@ def get_factory_cabinet(bot_id: int) -> dict:
     if b <= 0:
         return res
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             cur.execute(
                 "SELECT COALESCE(SUM(messages_count),0) FROM factory_user_activity WHERE bot_id = ?",
@@ -9496,7 +9639,7 @@ def create_managed_bot(
         return False, "Некорректные параметры.", None
 
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             # uniqueness by telegram_bot_user_id
             cur.execute("SELECT id, owner_telegram_id FROM managed_bots WHERE telegram_bot_user_id = ? LIMIT 1", (tg_bot_id,))
@@ -9552,7 +9695,7 @@ def record_factory_activity(bot_id: int, user_id: int) -> None:
     if u <= 0:
         return
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             cur.execute(
                 """
@@ -9627,7 +9770,7 @@ def accrue_partner_commission(
         return False
 
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
 
             # --- Self-purchase guard ---
@@ -9709,7 +9852,7 @@ def get_partner_cabinet(bot_id: int) -> dict:
         return res
 
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
 
             cur.execute("SELECT COUNT(1) FROM factory_user_activity WHERE bot_id = ?", (b,))
@@ -9749,7 +9892,7 @@ def list_partner_requisites(bot_id: int, owner_telegram_id: int) -> list[dict]:
     if b <= 0 or owner <= 0:
         return []
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cur = conn.cursor()
             cur.execute(
@@ -9809,7 +9952,7 @@ def add_partner_requisite(
         rtype = 'card'
 
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cur = conn.cursor()
 
@@ -9858,7 +10001,7 @@ def set_default_partner_requisite(req_id: int, bot_id: int, owner_telegram_id: i
         return False, 'Некорректные данные.'
 
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             cur.execute(
                 "SELECT id FROM partner_payout_requisites WHERE id = ? AND bot_id = ? AND owner_telegram_id = ?",
@@ -9895,7 +10038,7 @@ def delete_partner_requisite(req_id: int, bot_id: int, owner_telegram_id: int) -
         return False, 'Некорректные данные.'
 
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cur = conn.cursor()
             cur.execute(
@@ -9966,7 +10109,7 @@ def create_withdraw_request(
         return False, f"Недостаточно средств. Доступно: {available:.2f} RUB."
 
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             cur.execute(
                 """
@@ -10011,7 +10154,7 @@ def create_user_gift(
         if expires_in_days:
             expires_at = (datetime.utcnow() + timedelta(days=int(expires_in_days))).isoformat()
         
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cur = conn.cursor()
             
@@ -10040,7 +10183,7 @@ def create_user_gift(
 def get_user_gift(gift_id: int) -> dict | None:
     """Получить информацию о подарке по ID."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cur = conn.cursor()
             cur.execute("SELECT * FROM user_gifts WHERE gift_id = ?", (int(gift_id),))
@@ -10054,7 +10197,7 @@ def get_user_gift(gift_id: int) -> dict | None:
 def get_gift_by_code(gift_code: str) -> dict | None:
     """Получить информацию о подарке по коду."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cur = conn.cursor()
             cur.execute("SELECT * FROM user_gifts WHERE gift_code = ?", (str(gift_code).strip(),))
@@ -10074,7 +10217,7 @@ def get_user_inactive_gifts(from_user_id: int) -> list[dict]:
     подарки не должны продолжать висеть в списке пользователя.
     """
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cur = conn.cursor()
             cur.execute(
@@ -10127,7 +10270,7 @@ def activate_user_gift(
             if datetime.fromisoformat(expires_at) < datetime.utcnow():
                 return False, gift  # Expired
         
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             cur.execute(
                 """
@@ -10180,7 +10323,7 @@ def set_referred_by_from_gift(user_id: int, from_user_id: int, *, max_age_second
     if fid <= 0 or fid == uid:
         return False
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "SELECT referred_by, registration_date FROM users WHERE telegram_id = ?", (uid,)
@@ -10248,7 +10391,7 @@ def link_referrer_if_eligible(user_id: int, referrer_id: int, *, max_age_seconds
         return REFERRAL_LINK_SELF_FORBIDDEN
 
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
 
             cursor.execute("SELECT 1 FROM users WHERE telegram_id = ?", (rid,))
@@ -10312,7 +10455,7 @@ def unlink_referral(invitee_id: int, referrer_id: int) -> str:
         return REFERRAL_UNLINK_INVALID
 
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT referred_by FROM users WHERE telegram_id = ?", (uid,))
             row = cursor.fetchone()
@@ -10347,7 +10490,7 @@ def unlink_all_referrals(referrer_id: int) -> tuple[bool, int]:
         return False, 0
 
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "UPDATE users SET referred_by = NULL WHERE referred_by = ?",
@@ -10364,7 +10507,7 @@ def unlink_all_referrals(referrer_id: int) -> tuple[bool, int]:
 def delete_user_gift(gift_id: int) -> bool:
     """Удалить подарок."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             cur.execute("DELETE FROM user_gifts WHERE gift_id = ?", (int(gift_id),))
             conn.commit()
@@ -10377,7 +10520,7 @@ def delete_user_gift(gift_id: int) -> bool:
 def link_key_to_gift(gift_id: int, key_id: int) -> bool:
     """Связать созданный ключ с подарком."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             cur.execute(
                 "UPDATE user_gifts SET key_id = ? WHERE gift_id = ?",
@@ -10393,7 +10536,7 @@ def link_key_to_gift(gift_id: int, key_id: int) -> bool:
 def get_gift_code_by_key_id(key_id: int) -> str | None:
     """Получить код подарка по ID ключа."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cur = conn.cursor()
             cur.execute("SELECT gift_code FROM user_gifts WHERE key_id = ?", (int(key_id),))
@@ -10406,7 +10549,7 @@ def get_gift_code_by_key_id(key_id: int) -> str | None:
 def get_gift_code_by_key_id(key_id: int) -> str | None:
     """Получить код подарка по ID ключа."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cur = conn.cursor()
             cur.execute("SELECT gift_code FROM user_gifts WHERE key_id = ? AND is_activated = 0", (int(key_id),))
@@ -10419,7 +10562,7 @@ def get_gift_code_by_key_id(key_id: int) -> str | None:
 def get_gift_info_by_key_id(key_id: int) -> tuple[int | None, str | None]:
     """Получить ID и код подарка по ID ключа. Возвращает (gift_id, gift_code) или (None, None)."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cur = conn.cursor()
             cur.execute("SELECT gift_id, gift_code FROM user_gifts WHERE key_id = ? AND is_activated = 0", (int(key_id),))
@@ -10453,7 +10596,7 @@ def check_transaction_exists(payment_id: str) -> bool:
     if not payment_id:
         return False
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             cur.execute(
                 """
@@ -10545,7 +10688,7 @@ def get_user_by_auth_token(token: str) -> dict | None:
     if not token:
         return None
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cur = conn.cursor()
             cur.execute("SELECT * FROM users WHERE auth_token = ?", (str(token),))
@@ -10559,7 +10702,7 @@ def get_user_by_auth_token(token: str) -> dict | None:
 def get_auth_token_by_user_id(user_id: int) -> str | None:
     """Получить уже выданный постоянный auth-токен пользователя, если есть."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             cur.execute("SELECT auth_token FROM users WHERE telegram_id = ?", (int(user_id),))
             row = cur.fetchone()
@@ -10572,7 +10715,7 @@ def get_auth_token_by_user_id(user_id: int) -> str | None:
 def update_user_auth_token(user_id: int, token: str) -> bool:
     """Сохранить постоянный auth-токен для пользователя (webapp)."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             cur.execute("UPDATE users SET auth_token = ? WHERE telegram_id = ?", (str(token), int(user_id)))
             conn.commit()
@@ -10591,7 +10734,7 @@ def invalidate_all_user_auth_tokens() -> int:
     Возвращает число обновлённых строк.
     """
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             cur.execute(
                 "SELECT telegram_id FROM users WHERE auth_token IS NOT NULL AND TRIM(auth_token) != ''"
@@ -10643,7 +10786,7 @@ def get_user_by_email(email: str) -> dict | None:
     if not norm:
         return None
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cur = conn.cursor()
             cur.execute("SELECT * FROM users WHERE auth_email = ?", (norm,))
@@ -10667,7 +10810,7 @@ def create_user_by_email(email: str, password: str) -> dict | None:
         return None
     try:
         password_hash = hash_password(password)
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             cur.execute(
                 "SELECT MAX(telegram_id) FROM users WHERE telegram_id BETWEEN ? AND ?",
@@ -10696,7 +10839,7 @@ def update_user_password(email: str, new_password: str) -> bool:
         return False
     try:
         password_hash = hash_password(new_password)
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             cur.execute("UPDATE users SET auth_pass = ? WHERE auth_email = ?", (password_hash, norm))
             conn.commit()
@@ -10715,7 +10858,7 @@ def set_email_verification_code(user_id: int, code: str, ttl_seconds: int = 600)
     try:
         code_hash = _hash_verification_code(user_id, code)
         expires_at = (datetime.utcnow() + timedelta(seconds=ttl_seconds)).strftime("%Y-%m-%d %H:%M:%S")
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             cur.execute(
                 """
@@ -10735,7 +10878,7 @@ def set_email_verification_code(user_id: int, code: str, ttl_seconds: int = 600)
 def get_email_verification(user_id: int) -> dict | None:
     """Вернуть данные о статусе подтверждения email и последнем отправленном коде."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cur = conn.cursor()
             cur.execute(
@@ -10770,7 +10913,7 @@ def check_email_verification_code(user_id: int, code: str) -> bool:
 def mark_email_verified(user_id: int) -> bool:
     """Отметить email пользователя как подтверждённый и очистить код."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             cur.execute(
                 """
@@ -10790,7 +10933,7 @@ def mark_email_verified(user_id: int) -> bool:
 def update_email_code_last_sent(user_id: int) -> bool:
     """Обновить время последней отправки кода (для rate-limit повторной отправки)."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             cur.execute(
                 "UPDATE users SET email_code_last_sent_at = CURRENT_TIMESTAMP WHERE telegram_id = ?",
@@ -10808,7 +10951,7 @@ def update_user_password_by_id(user_id: int, new_password: str) -> bool:
     когда пользователь уже авторизован и email известен только по сессии, а не по вводу)."""
     try:
         password_hash = hash_password(new_password)
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             cur.execute("UPDATE users SET auth_pass = ? WHERE telegram_id = ?", (password_hash, int(user_id)))
             conn.commit()
@@ -10825,7 +10968,7 @@ def set_pending_email(user_id: int, new_email: str) -> bool:
     if not norm:
         return False
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             cur.execute("UPDATE users SET pending_email = ? WHERE telegram_id = ?", (norm, int(user_id)))
             conn.commit()
@@ -10838,7 +10981,7 @@ def set_pending_email(user_id: int, new_email: str) -> bool:
 def clear_pending_email(user_id: int) -> bool:
     """Отменить ожидающую смену email (например, пользователь передумал или запросил другой адрес)."""
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             cur = conn.cursor()
             cur.execute(
                 "UPDATE users SET pending_email = NULL, email_code_hash = NULL, email_code_expires_at = NULL "
@@ -10860,7 +11003,7 @@ def finalize_pending_email_change(user_id: int) -> tuple[bool, str | None]:
     переключиться на один и тот же email). Возвращает (ok, new_email_или_текст_ошибки).
     """
     try:
-        with sqlite3.connect(DB_FILE) as conn:
+        with _connect() as conn:
             conn.row_factory = sqlite3.Row
             cur = conn.cursor()
             cur.execute("SELECT pending_email FROM users WHERE telegram_id = ?", (int(user_id),))
@@ -0,0 +1,235 @@
+"""Пул SQLite-соединений для data_manager.
+
+Раньше каждый хелпер в `database.py` открывал новое `sqlite3.connect(DB_FILE)`:
+на каждый `get_setting`/`get_user` платили открытие файла, разбор схемы и
+(только в `_connect_pending_db`) настройку WAL/busy_timeout. Здесь соединения
+живут в пуле на поток (sqlite3 не разрешает делить соединение между потоками
+по умолчанию), PRAGMA применяются один раз при открытии, а подготовленные
+выражения кешируются самим sqlite3 (`cached_statements`).
+
+Использование полностью совместимо со старым `with sqlite3.connect(...) as conn:`:
+
+    with db_pool.connect(DB_FILE) as conn:
+        ...
+
+— на выходе из блока выполняется commit/rollback (как у sqlite3.Connection),
+после чего соединение возвращается в пул. Размер пула и таймауты задаются
+переменными окружения `SHOPBOT_DB_POOL_SIZE`, `SHOPBOT_DB_BUSY_TIMEOUT_MS`,
+`SHOPBOT_DB_STATEMENT_CACHE`; `SHOPBOT_DB_POOL_SIZE=0` возвращает старое
+поведение «соединение на вызов» (удобно для сравнения в бенчмарке).
+"""
+import logging
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, "").strip() or default)
+    except (TypeError, ValueError):
+        return default
+
+
+# Сколько простаивающих соединений держать на поток и на файл БД. Вложенные
+# вызовы (хелпер внутри открытого соединения зовёт get_setting) берут второе
+# соединение, поэтому значение > 1 имеет смысл.
+POOL_SIZE = max(0, _env_int("SHOPBOT_DB_POOL_SIZE", 4))
+BUSY_TIMEOUT_MS = max(0, _env_int("SHOPBOT_DB_BUSY_TIMEOUT_MS", 5000))
+STATEMENT_CACHE = max(0, _env_int("SHOPBOT_DB_STATEMENT_CACHE", 256))
+# Максимум разных файлов БД в пуле одного потока. В проде файл один, но тесты
+# подменяют DB_FILE на каждый тест — старые пулы нужно закрывать, иначе
+# утекают файловые дескрипторы.
+MAX_DATABASES_PER_THREAD = 4
+
+
+class _Stats:
+    __slots__ = ("hits", "misses", "opened", "closed", "discarded", "lock")
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.opened = 0
+        self.closed = 0
+        self.discarded = 0
+        self.lock = threading.Lock()
+
+    def incr(self, field: str, n: int = 1) -> None:
+        with self.lock:
+            setattr(self, field, getattr(self, field) + n)
+
+
+_stats = _Stats()
+_local = threading.local()
+
+
+def _open(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(
+        path,
+        timeout=max(BUSY_TIMEOUT_MS, 1) / 1000.0,
+        cached_statements=STATEMENT_CACHE,
+    )
+    try:
+        cur = conn.cursor()
+        cur.execute("PRAGMA journal_mode=WAL;")
+        cur.execute("PRAGMA synchronous=NORMAL;")
+        cur.execute(f"PRAGMA busy_timeout={int(BUSY_TIMEOUT_MS)};")
+        cur.close()
+    except sqlite3.Error as e:
+        logger.debug("db_pool: не удалось применить PRAGMA для %s: %s", path, e)
+    _stats.incr("opened")
+    return conn
+
+
+def _close(conn: sqlite3.Connection) -> None:
+    try:
+        conn.close()
+    except Exception:
+        pass
+    _stats.incr("closed")
+
+
+def _thread_pools() -> "OrderedDict[str, list[sqlite3.Connection]]":
+    pools = getattr(_local, "pools", None)
+    pid = os.getpid()
+    if pools is None or getattr(_local, "pid", None) != pid:
+        # После fork() соединения родителя использовать нельзя — просто
+        # забываем их (закрывать тоже небезопасно, они принадлежат родителю).
+        pools = OrderedDict()
+        _local.pools = pools
+        _local.pid = pid
+    return pools
+
+
+def _is_usable(conn: sqlite3.Connection) -> bool:
+    try:
+        conn.total_changes  # ProgrammingError, если соединение уже закрыто
+        return True
+    except sqlite3.ProgrammingError:
+        return False
+
+
+def acquire(path: str | os.PathLike) -> sqlite3.Connection:
+    """Взять соединение из пула текущего потока (или открыть новое)."""
+    key = str(path)
+    pools = _thread_pools()
+    idle = pools.get(key)
+    if idle is not None:
+        pools.move_to_end(key)
+        while idle:
+            conn = idle.pop()
+            if _is_usable(conn):
+                _stats.incr("hits")
+                return conn
+    _stats.incr("misses")
+    return _open(key)
+
+
+def release(path: str | os.PathLike, conn: sqlite3.Connection) -> None:
+    """Вернуть соединение в пул, сбросив состояние, которое мог поменять хелпер."""
+    if not _is_usable(conn):
+        return
+    try:
+        if conn.in_transaction:
+            conn.rollback()
+        conn.row_factory = None
+        conn.text_factory = str
+        if conn.isolation_level != "":
+            conn.isolation_level = ""
+    except sqlite3.Error:
+        _close(conn)
+        return
+
+    if POOL_SIZE <= 0:
+        _close(conn)
+        return
+
+    key = str(path)
+    pools = _thread_pools()
+    idle = pools.get(key)
+    if idle is None:
+        idle = pools[key] = []
+        while len(pools) > MAX_DATABASES_PER_THREAD:
+            _, stale = pools.popitem(last=False)
+            for c in stale:
+                _close(c)
+    pools.move_to_end(key)
+    if len(idle) >= POOL_SIZE:
+        _stats.incr("discarded")
+        _close(conn)
+        return
+    idle.append(conn)
+
+
+class _PooledConnection:
+    """Контекстный менеджер с семантикой `with sqlite3.connect(...) as conn`."""
+
+    __slots__ = ("_path", "_conn")
+
+    def __init__(self, path: str | os.PathLike) -> None:
+        self._path = path
+        self._conn: sqlite3.Connection | None = None
+
+    def __enter__(self) -> sqlite3.Connection:
+        self._conn = acquire(self._path)
+        return self._conn
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        conn = self._conn
+        self._conn = None
+        if conn is None:
+            return False
+        try:
+            if _is_usable(conn):
+                conn.__exit__(exc_type, exc, tb)
+        finally:
+            release(self._path, conn)
+        return False
+
+
+def connect(path: str | os.PathLike | Path) -> _PooledConnection:
+    """Пулированная замена `sqlite3.connect(path)` для использования в `with`."""
+    return _PooledConnection(path)
+
+
+def close_thread_connections() -> None:
+    """Закрыть все простаивающие соединения текущего потока."""
+    pools = getattr(_local, "pools", None)
+    if not pools or getattr(_local, "pid", None) != os.getpid():
+        _local.pools = OrderedDict()
+        _local.pid = os.getpid()
+        return
+    for idle in pools.values():
+        for conn in idle:
+            _close(conn)
+    pools.clear()
+
+
+def get_stats() -> dict[str, Any]:
+    """Счётчики пула (по процессу) для мониторинга и бенчмарков."""
+    with _stats.lock:
+        hits, misses = _stats.hits, _stats.misses
+        data = {
+            "hits": hits,
+            "misses": misses,
+            "opened": _stats.opened,
+            "closed": _stats.closed,
+            "discarded": _stats.discarded,
+        }
+    total = hits + misses
+    data["hit_ratio"] = round(hits / total, 4) if total else 0.0
+    data["pool_size"] = POOL_SIZE
+    data["busy_timeout_ms"] = BUSY_TIMEOUT_MS
+    data["statement_cache"] = STATEMENT_CACHE
+    return data
+
+
+def reset_stats() -> None:
+    with _stats.lock:
+        _stats.hits = _stats.misses = 0
+        _stats.opened = _stats.closed = _stats.discarded = 0
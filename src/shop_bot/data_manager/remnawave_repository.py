@@ -2,6 +2,7 @@ import json
 import logging
 import sqlite3
 import time
+from contextlib import contextmanager
 from contextvars import ContextVar
 from datetime import datetime, timedelta
 from typing import Any
@@ -129,10 +130,11 @@ def cancel_pending_transaction(payment_id: str, user_id: int | None = None) -> b
     return ok
 
 
-def _connect() -> sqlite3.Connection:
-    conn = sqlite3.connect(database.DB_FILE)
-    conn.row_factory = sqlite3.Row
-    return conn
+@contextmanager
+def _connect():
+    with database._connect() as conn:
+        conn.row_factory = sqlite3.Row
+        yield conn
 
 
 def _normalize_email(value: str | None) -> str:
@@ -550,6 +552,7 @@ _LEGACY_FORWARDERS = (
     "get_referral_count",
     "get_referrals_for_user",
     "get_setting",
+    "get_settings",
     "get_speedtests",
     "get_ticket",
     "get_ticket_by_thread",
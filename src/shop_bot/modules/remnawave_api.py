@@ -137,8 +137,9 @@ def _normalize_username_for_remnawave(name: str | None) -> str:
 
 def _load_config() -> dict[str, Any]:
     """Backward-compatible global config loader (deprecated)."""
-    base_url = (rw_repo.get_setting("remnawave_base_url") or "").strip().rstrip("/")
-    token = (rw_repo.get_setting("remnawave_api_token") or "").strip()
+    cfg = rw_repo.get_settings(("remnawave_base_url", "remnawave_api_token"))
+    base_url = (cfg["remnawave_base_url"] or "").strip().rstrip("/")
+    token = (cfg["remnawave_api_token"] or "").strip()
     cookies = {}
     is_local = False
     if not base_url or not token:
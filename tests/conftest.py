@@ -36,6 +36,7 @@ def temp_db(tmp_path, monkeypatch):
     database.update_setting("telegram_bot_token", FAKE_BOT_TOKEN)
     database.update_setting("telegram_bot_username", "TestVpnBot")
     yield database
+    database.db_pool.close_thread_connections()
 
 
 @pytest.fixture()
@@ -0,0 +1,90 @@
+"""
+Пул SQLite-соединений (`data_manager.db_pool`): соединения переиспользуются
+внутри потока, PRAGMA применены при открытии, состояние хелпера
+(row_factory, isolation_level, незакрытая транзакция) не протекает в
+следующий вызов.
+"""
+import sqlite3
+import threading
+
+from shop_bot.data_manager import db_pool
+
+
+def test_connection_is_reused_within_thread(temp_db):
+    db_pool.close_thread_connections()
+    db_pool.reset_stats()
+
+    for _ in range(10):
+        temp_db.get_setting("telegram_bot_token")
+
+    stats = db_pool.get_stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 9
+    assert stats["opened"] == 1
+
+
+def test_pragmas_applied_once_at_open(temp_db):
+    with temp_db._connect() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+        assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == db_pool.BUSY_TIMEOUT_MS
+
+
+def test_connection_state_is_reset_on_release(temp_db):
+    with temp_db._connect() as conn:
+        conn.row_factory = sqlite3.Row
+        conn.isolation_level = None
+        first = conn
+
+    with temp_db._connect() as conn:
+        assert conn is first
+        assert conn.row_factory is None
+        assert conn.isolation_level == ""
+        row = conn.execute("SELECT 1").fetchone()
+        assert isinstance(row, tuple)
+
+
+def test_exception_rolls_back_before_returning_to_pool(temp_db):
+    try:
+        with temp_db._connect() as conn:
+            conn.execute("INSERT INTO bot_settings (key, value) VALUES ('pool_probe', '1')")
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+
+    assert temp_db.get_setting("pool_probe") is None
+
+
+def test_nested_calls_use_separate_connections(temp_db):
+    with temp_db._connect() as outer:
+        with temp_db._connect() as inner:
+            assert inner is not outer
+
+
+def test_closed_connection_is_not_reused(temp_db):
+    with temp_db._connect() as conn:
+        conn.close()
+        closed = conn
+
+    with temp_db._connect() as conn:
+        assert conn is not closed
+        conn.execute("SELECT 1")
+
+
+def test_threads_get_their_own_connections(temp_db):
+    with temp_db._connect() as conn:
+        main_conn = conn
+
+    seen = []
+
+    def _worker():
+        with temp_db._connect() as conn:
+            seen.append(conn)
+            conn.execute("SELECT 1")
+        db_pool.close_thread_connections()
+
+    t = threading.Thread(target=_worker)
+    t.start()
+    t.join()
+
+    assert seen and seen[0] is not main_conn
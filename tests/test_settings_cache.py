@@ -0,0 +1,72 @@
+"""
+Кеш bot_settings: таблица читается в память один раз, update_setting
+обновляет кеш сразу (write-through), а запись в обход update_setting
+(другой процесс, модуль, прямой SQL) подхватывается по поколению
+`bot_settings_meta.generation`, которое увеличивают триггеры.
+"""
+import sqlite3
+
+from shop_bot.data_manager import db_pool
+
+
+def test_get_setting_served_from_memory(temp_db):
+    temp_db.get_setting("telegram_bot_token")
+    db_pool.reset_stats()
+
+    for _ in range(50):
+        assert temp_db.get_setting("telegram_bot_token") == "123456:FAKE_BOT_TOKEN_FOR_TESTS"
+        assert temp_db.get_setting("missing_key") is None
+
+    stats = db_pool.get_stats()
+    assert stats["hits"] + stats["misses"] <= 1
+
+
+def test_update_setting_is_write_through(temp_db):
+    temp_db.get_setting("telegram_bot_token")
+    temp_db.update_setting("some_flag", "true")
+    db_pool.reset_stats()
+
+    assert temp_db.get_setting("some_flag") == "true"
+    assert db_pool.get_stats()["hits"] + db_pool.get_stats()["misses"] == 0
+
+
+def test_bulk_get_settings(temp_db):
+    temp_db.update_setting("a_key", "1")
+    temp_db.update_setting("b_key", "2")
+
+    assert temp_db.get_settings(["a_key", "b_key", "nope"]) == {"a_key": "1", "b_key": "2", "nope": None}
+
+
+def test_external_write_invalidates_by_generation(temp_db, monkeypatch):
+    monkeypatch.setattr(temp_db, "SETTINGS_CACHE_CHECK_SEC", 0.0)
+    assert temp_db.get_setting("external_key") is None
+
+    with sqlite3.connect(temp_db.DB_FILE) as conn:
+        conn.execute("INSERT INTO bot_settings (key, value) VALUES ('external_key', 'x')")
+    assert temp_db.get_setting("external_key") == "x"
+
+    with sqlite3.connect(temp_db.DB_FILE) as conn:
+        conn.execute("DELETE FROM bot_settings WHERE key = 'external_key'")
+    assert temp_db.get_setting("external_key") is None
+
+
+def test_external_write_not_lost_by_local_update(temp_db, monkeypatch):
+    monkeypatch.setattr(temp_db, "SETTINGS_CACHE_CHECK_SEC", 3600.0)
+    temp_db.get_setting("telegram_bot_token")
+
+    with sqlite3.connect(temp_db.DB_FILE) as conn:
+        conn.execute("INSERT INTO bot_settings (key, value) VALUES ('other_process', 'y')")
+
+    # Локальная запись видит, что поколение ушло дальше чем на +1, и сбрасывает кеш.
+    temp_db.update_setting("local_key", "z")
+    assert temp_db.get_setting("local_key") == "z"
+    assert temp_db.get_setting("other_process") == "y"
+
+
+def test_cache_follows_db_file(temp_db, tmp_path, monkeypatch):
+    assert temp_db.get_setting("telegram_bot_token")
+
+    other = tmp_path / "other.db"
+    monkeypatch.setattr(temp_db, "DB_FILE", other)
+    temp_db.initialize_db()
+    assert temp_db.get_setting("telegram_bot_token") is None